@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import sys
 import os
+import csv
 import subprocess
 import threading
 import json
@@ -10,6 +11,8 @@ import time
 import re
 import io
 import tempfile
+from collections import deque
+from itertools import islice
 from datetime import datetime
 from pathlib import Path
 
@@ -47,6 +50,7 @@ CORS(app)
 
 # === Constants / paths ===
 PYTHON_EXEC = sys.executable
+MAIN_APP_URL = "http://127.0.0.1:5000"
 BASE_DIR = Path(__file__).resolve().parent  # /backend/
 PROJECT_ROOT = BASE_DIR.parent               
 INSTALL_DIR = PROJECT_ROOT                   
@@ -71,7 +75,49 @@ SPA_DIST = ADMIN_DIST_DIR
 
 STATIC_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
-main_app_logs = []
+# Lines kept from the main app output (oldest lines are dropped)
+ADMIN_LOG_CAPACITY = int(os.getenv("ADMIN_LOG_CAPACITY", "2000"))
+
+
+class LogRingBuffer:
+    """
+    Fixed-capacity log buffer. Every line gets an increasing sequence
+    number so pollers can ask only for what they have not seen yet.
+    """
+
+    def __init__(self, capacity):
+        self._lines = deque(maxlen=capacity)
+        self._next_seq = 0
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        with self._lock:
+            self._lines.append(line)
+            self._next_seq += 1
+
+    def since(self, seq):
+        """
+        Return (lines, next_seq, truncated) for lines numbered >= seq.
+        truncated is True when some of the requested lines were already
+        dropped, or when seq is ahead of the buffer (admin restarted) and
+        the whole buffer is returned instead.
+        """
+        with self._lock:
+            first_seq = self._next_seq - len(self._lines)
+            if seq > self._next_seq:
+                return list(self._lines), self._next_seq, True
+            start = max(seq, first_seq) - first_seq
+            return list(islice(self._lines, start, None)), self._next_seq, seq < first_seq
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._lines))
+
+    def __len__(self):
+        return len(self._lines)
+
+
+main_app_logs = LogRingBuffer(ADMIN_LOG_CAPACITY)
 app_process = None
 
 # === Git utilities ===
@@ -394,39 +440,143 @@ def safe_extract(zipf: zipfile.ZipFile, dest: Path):
             raise RuntimeError("Unsafe path in zip file")
     zipf.extractall(dest)
 
+# Longest line kept from the main app output; the rest is cut
+MAX_LOG_LINE_CHARS = 4000
+
 def capture_app_logs(process):
-    """Continuously read stdout from the main app process."""
+    """
+    Drain stdout from the main app process into main_app_logs.
+
+    Iterating the pipe blocks in the OS until a line or EOF arrives, so the
+    thread only wakes on output or exit. Each line is a constant-time append
+    to the ring buffer and is not echoed to the admin console, so the pipe
+    never fills up and a chatty child is never stalled by a slow reader.
+    """
     logger.info("Starting log capture thread...")
     try:
-        while True:
-            line = process.stdout.readline()
-            
-            # Check if process has ended
-            if process.poll() is not None:
-                # Process ended, read any remaining output
-                remaining = process.stdout.read()
-                if remaining:
-                    main_app_logs.append(remaining)
-                    logger.error(f"Process ended with remaining output: {remaining}")
-                break
-            
-            # Log the line if we have one
-            if line:
-                main_app_logs.append(line.rstrip())
-                logger.info(f"Main app output: {line.rstrip()}")
-            else:
-                # No line but process still running, just wait a bit
-                time.sleep(0.1)
-                
+        for line in process.stdout:
+            main_app_logs.append(line.rstrip()[:MAX_LOG_LINE_CHARS])
     except Exception as e:
         logger.error(f"Error in capture_app_logs: {e}")
     finally:
-        app.config["APP_RUNNING"] = False
-        exit_code = process.poll()
+        try:
+            exit_code = process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            exit_code = process.poll()
+        # A newer process may already have been started by /admin/start
+        if app_process is process:
+            app.config["APP_RUNNING"] = False
         logger.info(f"Main app process ended with exit code: {exit_code}")
         main_app_logs.append(f"{datetime.now()} - Process ended with exit code: {exit_code}")
 
 
+# GTFS members kept from an uploaded archive -> columns they must have.
+# Everything else (shapes.txt, ...) is never extracted.
+GTFS_REQUIRED_MEMBERS = {
+    "routes.txt":     {"route_id", "route_short_name"},
+    "trips.txt":      {"route_id", "service_id", "trip_id"},
+    "stop_times.txt": {"trip_id", "arrival_time", "stop_id"},
+}
+GTFS_OPTIONAL_MEMBERS = {
+    "calendar.txt":       {"service_id", "start_date", "end_date"},
+    "calendar_dates.txt": {"service_id", "date", "exception_type"},
+}
+
+def _find_gtfs_members(archive):
+    """Map each wanted file name to its archive member (shallowest path wins)."""
+    wanted = {**GTFS_REQUIRED_MEMBERS, **GTFS_OPTIONAL_MEMBERS}
+    found = {}
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        path = Path(info.filename.replace("\\", "/"))
+        name = path.name.lower()
+        if name not in wanted:
+            continue
+        if name not in found or len(path.parts) < len(Path(found[name].filename).parts):
+            found[name] = info
+    return found
+
+def _check_gtfs_header(path, required_columns):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        header = {column.strip() for column in next(csv.reader(f), [])}
+    missing = required_columns - header
+    if missing:
+        raise ValueError(f"{path.name}: colonnes manquantes {', '.join(sorted(missing))}")
+
+def compile_gtfs_cache(gtfs_dir):
+    """Compile the binary GTFS cache for gtfs_dir in a child process (raises on failure)."""
+    result = subprocess.run(
+        [PYTHON_EXEC, "-m", "backend.loaders.gtfs_cache", str(gtfs_dir)],
+        cwd=str(PROJECT_ROOT),
+        capture_output=True, text=True, timeout=900
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"GTFS cache compile failed: {result.stderr.strip()[-500:]}")
+    logger.info(f"GTFS cache compiled: {result.stdout.strip()}")
+
+def notify_main_app_gtfs_reload():
+    """Ask the running main app to swap in the new GTFS files (its file watcher is the fallback)."""
+    if not app.config["APP_RUNNING"]:
+        return
+    try:
+        requests.post(f"{MAIN_APP_URL}/api/reload_gtfs", timeout=5)
+    except Exception as e:
+        logger.warning(f"Could not notify the main app of the GTFS update: {e}")
+
+def ingest_gtfs_zip(zip_source, target_dir):
+    """
+    Install a GTFS archive into target_dir.
+
+    Only the members the app reads are streamed out of the zip, into a
+    staging directory next to target_dir. They are validated, the compiled
+    cache is built there, then each file is moved in with os.replace (new
+    cache first, CSV files last). The running app keeps its memory-mapped
+    cache, and a failed upload leaves target_dir untouched.
+    """
+    target_dir = Path(target_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    staging = target_dir.parent / f".staging_{target_dir.name}_{int(time.time())}"
+    staging.mkdir()
+    try:
+        with zipfile.ZipFile(zip_source) as archive:
+            members = _find_gtfs_members(archive)
+            missing = [name for name in GTFS_REQUIRED_MEMBERS if name not in members]
+            if missing:
+                raise ValueError(f"Fichiers manquants dans l'archive : {', '.join(missing)}")
+            for name, info in members.items():
+                with archive.open(info) as src, open(staging / name, "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+
+        for name in members:
+            required = GTFS_REQUIRED_MEMBERS.get(name) or GTFS_OPTIONAL_MEMBERS[name]
+            _check_gtfs_header(staging / name, required)
+
+        compile_gtfs_cache(staging)
+
+        # Cache files carry a new name, so they can land before the CSVs
+        staged = sorted(staging.iterdir(), key=lambda p: p.suffix == ".txt")
+        for path in staged:
+            target = target_dir / path.name
+            # Same cache key means same content; the installed copy may be
+            # memory-mapped by the running app, which blocks replacing it on Windows
+            if path.name.startswith("gtfs_cache-") and path.suffix == ".bin" and target.exists():
+                continue
+            os.replace(path, target)
+
+        # GTFS files from the previous feed that this archive does not have,
+        # and caches compiled for it (still mapped by the running app on Windows)
+        installed = {path.name for path in staged}
+        for old in [*target_dir.glob("*.txt"), *target_dir.glob("gtfs_cache-*.bin")]:
+            if old.name not in installed:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+        return sorted(members)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
 def load_auto_update_cfg():
     default = {"enabled": True, "time": "20:00"}
     if AUTO_UPDATE_CFG.exists():
@@ -753,31 +903,11 @@ def admin_update_gtfs():
     if transport == "stm":
         target = stm_dir
 
-    timestamp = int(time.time())
-    tmp_zip = GTFS_ROOT / f"{transport}_uploaded_{timestamp}.zip"
-    staging = GTFS_ROOT / f".tmp_extract_{transport}_{timestamp}"
-
     try:
-        z.save(tmp_zip)
-
-        with zipfile.ZipFile(tmp_zip, "r") as archive:
-            archive.extractall(staging)
-
-        entries = list(staging.iterdir())
-        if len(entries) == 1 and entries[0].is_dir():
-            extracted_root = entries[0]
-        else:
-            extracted_root = staging
-
-        if target.exists():
-            shutil.rmtree(target)
-        shutil.move(str(extracted_root), str(target))
-
-        if staging.exists():
-            try:
-                shutil.rmtree(staging)
-            except:
-                pass
+        # The upload is read in place; only the needed members hit the disk
+        installed = ingest_gtfs_zip(z.stream, target)
+        logger.info(f"GTFS {transport} installed: {', '.join(installed)}")
+        notify_main_app_gtfs_reload()
 
         # Record update time
         info = load_gtfs_update_info()
@@ -789,17 +919,6 @@ def admin_update_gtfs():
     except Exception as e:
         logger.exception("GTFS update failed")
         flash(f"Erreur d'extraction ou de mise à jour : {e}", "danger")
-    finally:
-        if tmp_zip.exists():
-            try:
-                tmp_zip.unlink()
-            except:
-                pass
-        if staging.exists():
-            try:
-                shutil.rmtree(staging)
-            except:
-                pass
 
     return redirect(url_for("serve_spa", path=""))
 
@@ -825,9 +944,13 @@ def admin_start():
             app_process = subprocess.Popen(
                 cmd,
                 cwd=str(PROJECT_ROOT), 
+                # Child output is decoded as UTF-8 below, whatever the console code page
+                env={**os.environ, "PYTHONIOENCODING": "utf-8"},
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
-                universal_newlines=True,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
             )
             app.config["APP_RUNNING"] = True
             main_app_logs.append(f"{datetime.now()} - Main app started.")
@@ -859,7 +982,16 @@ def admin_status():
 
 @app.route("/admin/logs_data")
 def logs_data():
-    return "\n".join(main_app_logs)
+    """
+    Without arguments: the buffered log as plain text.
+    With ?since=N: JSON {"lines", "next", "truncated"} holding only lines
+    numbered N and above; pass "next" back as `since` on the following poll.
+    """
+    since = request.args.get("since", type=int)
+    if since is None:
+        return "\n".join(main_app_logs)
+    lines, next_seq, truncated = main_app_logs.since(max(since, 0))
+    return jsonify({"lines": lines, "next": next_seq, "truncated": truncated})
 
 def auto_update_worker():
     while True:
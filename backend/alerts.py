@@ -2,171 +2,255 @@
 STM Alerts Processing Module
 Filters alerts to only show relevant ones for your specific stops
 """
+import re
+import json
+import hashlib
+import logging
+from typing import NamedTuple
+
+from .records import Alert
+
+logger = logging.getLogger('BdeB-GTFS')
 
 # Your specific stops - only show alerts for these
 OUR_STOP_IDS = {"52743", "52744", "62248", "62355"}
 OUR_ROUTES = {"36", "61"}
 
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+# Any of our stop ids inside a description (route alerts without stop entities)
+_OUR_STOPS_RE = re.compile("|".join(re.escape(stop_id) for stop_id in sorted(OUR_STOP_IDS)))
+
+
+class NormalizedAlert(NamedTuple):
+    """One STM alert with its French text resolved and entities flattened."""
+    digest: str               # content hash of the raw alert
+    header: str               # French header
+    description: str          # French description, HTML tags removed
+    is_network_wide: bool     # an informed entity is the whole STM agency
+    routes: frozenset         # route_short_name of the informed entities
+    stops: frozenset          # stop_code of the informed entities
+    entities: tuple           # (route_short_name, route_id, stop_code) per entity
+
+# Shared alert table: built once per fetched payload, read by both the bus
+# alert filter below and the metro status builder in main.py
+_alert_table = {
+    "payload": None,  # raw list returned by fetch_stm_alerts()
+    "alerts":  (),    # tuple of NormalizedAlert
+}
+# digest -> NormalizedAlert, only for digests present in the last payload
+_normalized_memo = {}
+
+# digest -> processed bus alert (None when not relevant), same lifetime
+_alert_memo = {}
+
+# Last processed table and its route/stop index
+_processed = {
+    "table":    None,
+    "alerts":   [],
+    "index":    {"by_route": {}, "by_stop": {}},
+}
+
+def alert_digest(alert):
+    """Content hash of a raw alert; unchanged alerts keep the same digest."""
+    encoded = json.dumps(alert, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+def build_alert_index(alerts):
+    """Inverted index of processed Alerts: {"by_route": {route: [alert]}, "by_stop": {stop: [alert]}}."""
+    by_route = {}
+    by_stop = {}
+    for alert in alerts:
+        for route in alert.routes:
+            by_route.setdefault(route, []).append(alert)
+        for stop in alert.stops:
+            by_stop.setdefault(stop, []).append(alert)
+    return {"by_route": by_route, "by_stop": by_stop}
+
+def _french_text(texts):
+    for text in texts:
+        if text.get("language") == "fr":
+            return text.get("text", "")
+    return ""
+
+def normalize_alert(alert, digest=None):
+    """Resolve the French header/description and flatten the informed entities."""
+    informed_entities = alert.get("informed_entities", [])
+    entities = tuple(
+        (entity.get("route_short_name") or "", entity.get("route_id") or "", entity.get("stop_code") or "")
+        for entity in informed_entities
+    )
+    return NormalizedAlert(
+        digest=digest or alert_digest(alert),
+        header=_french_text(alert.get("header_texts", [])),
+        description=_HTML_TAG_RE.sub('', _french_text(alert.get("description_texts", []))).strip(),
+        is_network_wide=any(entity.get("agency_id") == "STM" for entity in informed_entities),
+        routes=frozenset(route for (route, _, _) in entities if route),
+        stops=frozenset(stop for (_, _, stop) in entities if stop),
+        entities=entities,
+    )
+
+def normalize_stm_alerts(raw_alerts):
+    """
+    Normalize a fetched payload into a tuple of NormalizedAlert. The same
+    payload returns the same tuple; alerts seen in the previous payload are
+    reused by content hash.
+    """
+    global _normalized_memo
+    if raw_alerts is _alert_table["payload"]:
+        return _alert_table["alerts"]
+
+    memo = {}
+    normalized = []
+    for alert in raw_alerts or []:
+        try:
+            digest = alert_digest(alert)
+            item = memo.get(digest) or _normalized_memo.get(digest) or normalize_alert(alert, digest)
+        except Exception as e:
+            logger.error(f"  [ERROR] Normalizing alert: {e}", exc_info=True)
+            continue
+        memo[digest] = item
+        normalized.append(item)
+
+    _normalized_memo = memo
+    _alert_table["payload"] = raw_alerts
+    _alert_table["alerts"] = tuple(normalized)
+    return _alert_table["alerts"]
+
+def get_alert_table():
+    """Fetch the STM alerts (cached upstream) and return the normalized table."""
+    from .loaders.stm import fetch_stm_alerts
+    return normalize_stm_alerts(fetch_stm_alerts())
+
+def get_alert_index(alerts=None):
+    """
+    Route/stop index for `alerts` (default: the last processed alerts).
+    The index of the last processed payload is reused, not rebuilt.
+    """
+    if alerts is None or alerts is _processed["alerts"]:
+        return _processed["index"]
+    return build_alert_index(alerts)
+
+def _process_alert(alert):
+    """Classify one NormalizedAlert. Returns the Alert to show, or None."""
+    logger.debug(f"  Informed entities: {alert.entities}")
+
+    is_network_alert = alert.is_network_wide
+    affected_routes = alert.routes
+    affected_stops = alert.stops
+    if is_network_alert:
+        logger.debug("  -> This is a NETWORK-WIDE alert")
+
+    # Route alerts for other lines are dropped
+    our_routes = affected_routes & OUR_ROUTES
+    if not is_network_alert:
+        if not affected_routes:
+            logger.debug("  [SKIP] No agency_id or route info")
+            return None
+        if not our_routes:
+            logger.debug(f"  [SKIP] Routes {set(affected_routes)} don't include 36 or 61")
+            return None
+        if affected_stops and not affected_stops & OUR_STOP_IDS:
+            logger.debug(f"  [SKIP] Stops {set(affected_stops)} don't include our stops {OUR_STOP_IDS}")
+            return None
+
+    french_header = alert.header
+    french_description = alert.description
+
+    logger.debug(f"  Header: {french_header[:50]}...")
+    logger.debug(f"  Description: {french_description[:80]}...")
+
+    if is_network_alert:
+        # NETWORK-WIDE ALERT - Always include
+        logger.debug("  [OK] Added as NETWORK alert")
+        return Alert(
+            header=french_header or "Alerte STM",
+            description=french_description or "Aucune description disponible",
+            is_network_wide=True,
+            alert_type="general_network",
+            severity="info"
+        )
+
+    if affected_stops:
+        # STOP-SPECIFIC ALERT for our stops!
+        our_stops = affected_stops & OUR_STOP_IDS
+        logger.debug(f"  [OK] Added as STOP alert for stops {', '.join(our_stops)} on route {', '.join(our_routes)}")
+        return Alert(
+            header=french_header or "Alerte d'arrêt",
+            description=french_description or "Aucune description disponible",
+            routes=list(our_routes),
+            stops=list(our_stops),
+            alert_type="stop_specific",
+            severity="warning"
+        )
+
+    # General route alert (no specific stops in informed_entities)
+    # BUT we need to check if the description mentions our stops
+    mentioned = _OUR_STOPS_RE.search(french_description)
+    if not mentioned:
+        logger.debug("  [SKIP] Route alert doesn't mention our specific stops in description")
+        return None
+
+    logger.debug(f"  -> Found our stop {mentioned.group(0)} in description!")
+    logger.debug(f"  [OK] Added as ROUTE alert (mentions our stops in text) for {', '.join(our_routes)}")
+    return Alert(
+        header=french_header or "Alerte de ligne",
+        description=french_description or "Aucune description disponible",
+        routes=list(our_routes),
+        alert_type="route_specific",
+        severity="warning"
+    )
+
 def process_stm_alerts():
     """
-    Process STM alerts directly from raw API data
+    Process STM alerts from the shared normalized alert table
     Shows:
     - ALL network-wide alerts (like strikes)
     - Alerts for routes 36, 61 that affect our specific stops
     - General route alerts (without specific stops) for routes 36, 61
+
+    The result is reused while the alert table is unchanged, and each alert
+    is only reclassified when its content hash is new.
     """
-    from .loaders.stm import fetch_stm_alerts
-    import re
-    
-    all_alerts = []
-    
+    global _alert_memo
+
     try:
-        print("=" * 60)
-        print("FETCHING STM ALERTS (DIRECT FROM API)...")
-        
-        # Fetch raw alerts directly
-        raw_alerts = fetch_stm_alerts()
-        print(f"Got {len(raw_alerts)} raw alerts from STM API")
-        
-        if not raw_alerts:
-            print("No alerts returned from STM API")
-            return []
-        
-        # Process each raw alert
-        for i, alert in enumerate(raw_alerts):
+        table = get_alert_table()
+        logger.debug(f"Got {len(table)} STM alerts")
+
+        if table is _processed["table"]:
+            return _processed["alerts"]
+
+        all_alerts = []
+        memo = {}
+        reprocessed = 0
+
+        # Process each alert
+        for i, alert in enumerate(table):
             try:
-                print(f"\nProcessing alert {i+1}...")
-                
-                # Get informed entities
-                informed_entities = alert.get("informed_entities", [])
-                print(f"  Informed entities: {informed_entities}")
-                
-                # Check if network-wide alert
-                is_network_alert = False
-                affected_routes = set()
-                affected_stops = set()
-                
-                for entity in informed_entities:
-                    if entity.get("agency_id") == "STM":
-                        is_network_alert = True
-                        print("  -> This is a NETWORK-WIDE alert")
-                    
-                    route = entity.get("route_short_name")
-                    if route:
-                        affected_routes.add(route)
-                        print(f"  -> Affects route: {route}")
-                    
-                    # Check for stop_code
-                    stop_code = entity.get("stop_code")
-                    if stop_code:
-                        affected_stops.add(stop_code)
-                        print(f"  -> Affects stop: {stop_code}")
-                
-                # Get French header and description
-                header_texts = alert.get("header_texts", [])
-                description_texts = alert.get("description_texts", [])
-                
-                french_header = ""
-                french_description = ""
-                
-                for header in header_texts:
-                    if header.get("language") == "fr":
-                        french_header = header.get("text", "")
-                        break
-                
-                for desc in description_texts:
-                    if desc.get("language") == "fr":
-                        french_description = desc.get("text", "")
-                        break
-                
-                # Remove HTML tags
-                french_description = re.sub(r'<[^>]+>', '', french_description)
-                
-                print(f"  Header: {french_header[:50]}...")
-                print(f"  Description: {french_description[:80]}...")
-                
-                # Decide what to do with this alert
-                if is_network_alert:
-                    # NETWORK-WIDE ALERT - Always include
-                    alert_obj = {
-                        "header": french_header or "Alerte STM",
-                        "description": french_description or "Aucune description disponible",
-                        "routes": [],
-                        "is_network_wide": True,
-                        "alert_type": "general_network",
-                        "severity": "info"
-                    }
-                    all_alerts.append(alert_obj)
-                    print("  [OK] Added as NETWORK alert")
-                    
-                elif affected_routes:
-                    # Check if our routes (36, 61) are affected
-                    our_routes = affected_routes & OUR_ROUTES
-                    
-                    if our_routes:
-                        # Check if alert mentions specific stops
-                        if affected_stops:
-                            # This alert is for specific stops - check if it's one of ours
-                            our_stops = affected_stops & OUR_STOP_IDS
-                            
-                            if our_stops:
-                                # STOP-SPECIFIC ALERT for our stops!
-                                alert_obj = {
-                                    "header": french_header or "Alerte d'arrêt",
-                                    "description": french_description or "Aucune description disponible",
-                                    "routes": list(our_routes),
-                                    "stops": list(our_stops),
-                                    "is_network_wide": False,
-                                    "alert_type": "stop_specific",
-                                    "severity": "warning"
-                                }
-                                all_alerts.append(alert_obj)
-                                print(f"  [OK] Added as STOP alert for stops {', '.join(our_stops)} on route {', '.join(our_routes)}")
-                            else:
-                                print(f"  [SKIP] Stops {affected_stops} don't include our stops {OUR_STOP_IDS}")
-                        else:
-                            # General route alert (no specific stops in informed_entities)
-                            # BUT we need to check if the description mentions our stops
-                            mentioned_our_stops = False
-                            for stop_id in OUR_STOP_IDS:
-                                if stop_id in french_description:
-                                    mentioned_our_stops = True
-                                    print(f"  -> Found our stop {stop_id} in description!")
-                                    break
-                            
-                            if mentioned_our_stops:
-                                # The description mentions one of our stops
-                                alert_obj = {
-                                    "header": french_header or "Alerte de ligne",
-                                    "description": french_description or "Aucune description disponible",
-                                    "routes": list(our_routes),
-                                    "is_network_wide": False,
-                                    "alert_type": "route_specific",
-                                    "severity": "warning"
-                                }
-                                all_alerts.append(alert_obj)
-                                print(f"  [OK] Added as ROUTE alert (mentions our stops in text) for {', '.join(our_routes)}")
-                            else:
-                                print(f"  [SKIP] Route alert doesn't mention our specific stops in description")
-                    else:
-                        print(f"  [SKIP] Routes {affected_routes} don't include 36 or 61")
+                if alert.digest in memo:
+                    result = memo[alert.digest]
+                elif alert.digest in _alert_memo:
+                    result = _alert_memo[alert.digest]
                 else:
-                    print("  [SKIP] No agency_id or route info")
-                
+                    logger.debug(f"Processing alert {i+1}...")
+                    result = _process_alert(alert)
+                    reprocessed += 1
+                memo[alert.digest] = result
+                if result is not None:
+                    all_alerts.append(result)
             except Exception as e:
-                print(f"  [ERROR] Processing alert {i+1}: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.error(f"  [ERROR] Processing alert {i+1}: {e}", exc_info=True)
                 continue
-        
-        print(f"\n{'=' * 60}")
-        print(f"TOTAL ALERTS PROCESSED: {len(all_alerts)}")
-        print(f"{'=' * 60}\n")
-        
+
+        _alert_memo = memo
+        _processed["table"] = table
+        _processed["alerts"] = all_alerts
+        _processed["index"] = build_alert_index(all_alerts)
+
+        logger.debug(f"TOTAL ALERTS PROCESSED: {len(all_alerts)} ({reprocessed} new or changed)")
+
         return all_alerts
-        
+
     except Exception as e:
-        print(f"CRITICAL ERROR in process_stm_alerts: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
\ No newline at end of file
+        logger.error(f"CRITICAL ERROR in process_stm_alerts: {e}", exc_info=True)
+        return []
@@ -17,6 +17,26 @@ WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
 # Global delay configuration
 GLOBAL_DELAY_MINUTES = int(os.getenv("GLOBAL_DELAY_MINUTES", "0"))
 
+# Background refresh interval for the STM realtime feeds (seconds)
+REALTIME_POLL_SECONDS = int(os.getenv("REALTIME_POLL_SECONDS", "20"))
+
+# Upstream HTTP timeouts (seconds) for the STM and WeatherAPI calls
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+
+# Server-Sent Events (/api/stream): each client holds a server thread
+SSE_MAX_CLIENTS = int(os.getenv("SSE_MAX_CLIENTS", "4"))
+SSE_KEEPALIVE_SECONDS = int(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+# Logging: DEBUG prints per-vehicle / per-alert details, WARNING keeps the
+# refresh loop silent unless something goes wrong
+LOG_LEVEL = os.getenv(
+    "LOG_LEVEL",
+    "DEBUG" if os.getenv("ENVIRONMENT") == "development" else "WARNING"
+).upper()
+# Log records waiting for the console writer; extra records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
 if not STM_API_KEY:
     raise ValueError("STM_API_KEY not found in environment variables")
 if not WEATHER_API_KEY:
@@ -37,6 +57,9 @@ BUS_ROUTE_COMBOS = [
     ("36", "62355", "36_Ouest"),
 ]
 
+# Number of upcoming realtime departures kept per combo ("upcoming" in /api/data)
+BUS_UPCOMING_DEPARTURES = max(1, int(os.getenv("BUS_UPCOMING_DEPARTURES", "3")))
+
 BUS_DISPLAY_INFO = {
     "61_Est": {
         "direction": "Est",
@@ -54,4 +77,23 @@ BUS_DISPLAY_INFO = {
         "direction": "Ouest",
         "location": "Notre-Dame / Peel"
     },
-}
\ No newline at end of file
+}
+
+# ============================================================================
+# GTFS STATIC LOADING
+# ============================================================================
+
+# Only keep trips/stop_times for the configured routes and stops above.
+# Set GTFS_FILTERED_LOAD=0 to load the whole STM network.
+GTFS_FILTERED_LOAD = os.getenv("GTFS_FILTERED_LOAD", "1") == "1"
+
+# Extra routes/stops to keep when filtering (comma-separated, e.g. "24,150")
+GTFS_EXTRA_ROUTES = [r.strip() for r in os.getenv("GTFS_EXTRA_ROUTES", "").split(",") if r.strip()]
+GTFS_EXTRA_STOP_IDS = [s.strip() for s in os.getenv("GTFS_EXTRA_STOP_IDS", "").split(",") if s.strip()]
+
+# Worker processes used to compile the GTFS cache (0 = one per CPU core)
+GTFS_PARSE_WORKERS = int(os.getenv("GTFS_PARSE_WORKERS", "0"))
+
+# Check the GTFS files for changes every N seconds and reload them in the
+# background (0 disables the check; the admin still triggers a reload)
+GTFS_WATCH_SECONDS = int(os.getenv("GTFS_WATCH_SECONDS", "60"))
@@ -0,0 +1,266 @@
+"""
+Compiled GTFS Cache
+Compiles routes.txt, trips.txt and stop_times.txt into a compact columnar
+binary file and memory-maps it on startup, so a restart does not re-parse
+the CSV files and several worker processes share the same pages.
+
+Run `python -m backend.loaders.gtfs_cache [gtfs_dir]` from the project root
+to compile the cache ahead of time (the admin does this for every GTFS
+upload, in the staging directory before the files are swapped in).
+"""
+import os
+import sys
+import json
+import mmap
+import glob
+import struct
+import hashlib
+import subprocess
+from array import array
+
+from backend.config import GTFS_PARSE_WORKERS
+from backend.loaders.stm import (
+    load_stm_routes,
+    load_stm_gtfs_trips,
+    load_stm_stop_times,
+    get_gtfs_load_filter,
+    PackedStopTimes,
+)
+
+CACHE_MAGIC = b"ETSGTFS\x01"
+CACHE_FORMAT_VERSION = 2
+CACHE_PREFIX = "gtfs_cache-"
+# Remembers file hashes by (size, mtime) so unchanged sources are not rehashed
+HASH_STAMP_FILE = "gtfs_cache_hashes.json"
+SOURCE_FILES = ["routes.txt", "trips.txt", "stop_times.txt"]
+
+_HEADER = struct.Struct("<8sI")  # magic, metadata length
+
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compute_cache_key(gtfs_dir, route_ids, stop_ids):
+    """
+    Key the cache on the source file hashes, the load filter and the format.
+    Hashes are reused from the stamp file while a file's size/mtime are unchanged.
+    """
+    stamp_path = os.path.join(gtfs_dir, HASH_STAMP_FILE)
+    try:
+        with open(stamp_path, "r", encoding="utf-8") as f:
+            stamps = json.load(f)
+    except Exception:
+        stamps = {}
+
+    parts = [f"v{CACHE_FORMAT_VERSION}", sys.byteorder]
+    updated = False
+    for name in SOURCE_FILES:
+        path = os.path.join(gtfs_dir, name)
+        st = os.stat(path)
+        stat_sig = [st.st_size, st.st_mtime_ns]
+        cached = stamps.get(name)
+        if cached and cached[:2] == stat_sig:
+            file_hash = cached[2]
+        else:
+            file_hash = _file_sha1(path)
+            stamps[name] = stat_sig + [file_hash]
+            updated = True
+        parts.append(f"{name}:{file_hash}")
+
+    parts.append("routes:" + (",".join(sorted(route_ids)) if route_ids is not None else "*"))
+    parts.append("stops:" + (",".join(sorted(stop_ids)) if stop_ids is not None else "*"))
+
+    if updated:
+        try:
+            with open(stamp_path, "w", encoding="utf-8") as f:
+                json.dump(stamps, f)
+        except Exception as e:
+            print(f"[GTFS CACHE] Could not save hash stamps: {e}")
+
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def _cache_path(gtfs_dir, key):
+    return os.path.join(gtfs_dir, f"{CACHE_PREFIX}{key[:16]}.bin")
+
+
+def compile_gtfs_cache(gtfs_dir, route_ids=None, stop_ids=None, key=None, workers=1):
+    """
+    Parse the GTFS CSV files and write the columnar cache.
+    With workers > 1 the files are parsed in a process pool (see
+    gtfs_parallel; only safe when run through this module's CLI).
+    Returns the path of the written cache file.
+    """
+    if key is None:
+        key = compute_cache_key(gtfs_dir, route_ids, stop_ids)
+
+    if workers > 1:
+        from backend.loaders.gtfs_parallel import load_gtfs_tables_parallel
+        routes_map, trips, stop_times = load_gtfs_tables_parallel(
+            gtfs_dir, route_ids, stop_ids, workers=workers
+        )
+    else:
+        routes_map = load_stm_routes(os.path.join(gtfs_dir, "routes.txt"))
+        trips = load_stm_gtfs_trips(os.path.join(gtfs_dir, "trips.txt"), routes_map, route_ids=route_ids)
+        stop_times = load_stm_stop_times(
+            os.path.join(gtfs_dir, "stop_times.txt"),
+            stop_ids=stop_ids,
+            trip_ids=set(trips) if route_ids is not None else None
+        )
+
+    trip_ids = sorted(trips)
+    trip_index = {trip_id: i for i, trip_id in enumerate(trip_ids)}
+    stop_id_list = sorted({stop_id for (_, stop_id, _) in stop_times.rows()})
+    stop_index = {stop_id: i for i, stop_id in enumerate(stop_id_list)}
+    route_names = sorted({info["route_id"] for info in trips.values()})
+    route_index = {name: i for i, name in enumerate(route_names)}
+
+    rows = []
+    for trip_id, stop_id, arrival in stop_times.rows():
+        t = trip_index.get(trip_id)
+        if t is None:
+            continue  # stop_time for a trip missing from trips.txt
+        rows.append((t, stop_index[stop_id], arrival))
+    rows.sort()
+
+    meta = {
+        "key": key,
+        "byteorder": sys.byteorder,
+        "routes_map": routes_map,
+        "route_names": route_names,
+        "trip_ids": trip_ids,
+        "trip_routes": [route_index[trips[t]["route_id"]] for t in trip_ids],
+        "trip_wheelchair": [trips[t]["wheelchair_accessible"] for t in trip_ids],
+        "trip_services": [trips[t]["service_id"] for t in trip_ids],
+        "stop_ids": stop_id_list,
+        "rows": len(rows),
+    }
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    # Pad so the int32 columns start 4-byte aligned
+    meta_bytes += b" " * (-(_HEADER.size + len(meta_bytes)) % 4)
+
+    path = _cache_path(gtfs_dir, key)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(CACHE_MAGIC, len(meta_bytes)))
+        f.write(meta_bytes)
+        for col in range(3):
+            array("i", (row[col] for row in rows)).tofile(f)
+    os.replace(tmp_path, path)
+
+    _remove_stale_caches(gtfs_dir, keep=path)
+    print(f"[GTFS CACHE] Compiled {len(trip_ids)} trips / {len(rows)} stop times -> {os.path.basename(path)}")
+    return path
+
+
+def _remove_stale_caches(gtfs_dir, keep):
+    for old in glob.glob(os.path.join(gtfs_dir, f"{CACHE_PREFIX}*.bin")):
+        if os.path.abspath(old) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(old)
+        except OSError:
+            # Still mapped by a running process (Windows); removed next time
+            pass
+
+
+def load_gtfs_cache(path):
+    """
+    Memory-map a compiled cache.
+    Returns (routes_map, stm_trips, stm_stop_times) or None if the file is unusable.
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, meta_len = _HEADER.unpack_from(mm, 0)
+    if magic != CACHE_MAGIC:
+        mm.close()
+        return None
+    meta = json.loads(bytes(mm[_HEADER.size:_HEADER.size + meta_len]))
+    if meta.get("byteorder") != sys.byteorder:
+        mm.close()
+        return None
+
+    n = meta["rows"]
+    offset = _HEADER.size + meta_len
+    view = memoryview(mm)
+    columns = []
+    for _ in range(3):
+        columns.append(view[offset:offset + 4 * n].cast("i"))
+        offset += 4 * n
+
+    route_names = meta["route_names"]
+    stm_trips = {
+        trip_id: {
+            "route_id": route_names[route_i],
+            "wheelchair_accessible": wheelchair,
+            "service_id": service_id,
+        }
+        for trip_id, route_i, wheelchair, service_id in zip(
+            meta["trip_ids"], meta["trip_routes"], meta["trip_wheelchair"], meta["trip_services"]
+        )
+    }
+    stm_stop_times = PackedStopTimes(meta["trip_ids"], meta["stop_ids"], *columns)
+    return meta["routes_map"], stm_trips, stm_stop_times
+
+
+def load_or_compile_gtfs_cache(gtfs_dir, route_ids=None, stop_ids=None):
+    """
+    Load the compiled cache matching the current source files and filter,
+    compiling it first if it is missing or stale.
+    Returns (routes_map, stm_trips, stm_stop_times).
+    """
+    key = compute_cache_key(gtfs_dir, route_ids, stop_ids)
+    path = _cache_path(gtfs_dir, key)
+    if os.path.isfile(path):
+        try:
+            loaded = load_gtfs_cache(path)
+            if loaded is not None:
+                print(f"[GTFS CACHE] Loaded {os.path.basename(path)}")
+                return loaded
+        except Exception as e:
+            print(f"[GTFS CACHE] Could not read {path}, recompiling: {e}")
+
+    # Compile in a fresh interpreter so the parse can use a process pool;
+    # stay in-process if that fails or was keyed on a different filter
+    if not _compile_in_subprocess(gtfs_dir) or not os.path.isfile(path):
+        path = compile_gtfs_cache(gtfs_dir, route_ids, stop_ids, key=key)
+    return load_gtfs_cache(path)
+
+
+def parse_workers():
+    return GTFS_PARSE_WORKERS if GTFS_PARSE_WORKERS > 0 else (os.cpu_count() or 1)
+
+
+def _compile_in_subprocess(gtfs_dir):
+    """Run `python -m backend.loaders.gtfs_cache gtfs_dir`; True on success."""
+    if parse_workers() <= 1 or getattr(sys, "frozen", False):
+        return False
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        result = subprocess.run(
+            [sys.executable, "-m", "backend.loaders.gtfs_cache", os.path.abspath(gtfs_dir)],
+            cwd=project_root, capture_output=True, text=True, timeout=900
+        )
+    except Exception as e:
+        print(f"[GTFS CACHE] Parallel compile unavailable: {e}")
+        return False
+    if result.returncode != 0:
+        print(f"[GTFS CACHE] Parallel compile failed: {result.stderr.strip()[-500:]}")
+        return False
+    print(result.stdout.strip())
+    return True
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        stm_dir = sys.argv[1]
+    else:
+        stm_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "GTFS", "stm")
+    load_routes, load_stops = get_gtfs_load_filter()
+    compile_gtfs_cache(stm_dir, load_routes, load_stops, workers=parse_workers())
@@ -0,0 +1,118 @@
+"""
+Parallel GTFS Parsing
+Parses trips.txt and stop_times.txt across a process pool. stop_times.txt
+is split into byte ranges aligned on line starts, each range is parsed and
+filtered by a worker, and the partial results are merged in file order.
+
+Only use this from a process whose __main__ is import-safe (the
+`python -m backend.loaders.gtfs_cache` compiler): worker processes are
+spawned on Windows and re-import the main module.
+"""
+import os
+import csv
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.loaders.stm import (
+    load_stm_routes,
+    load_stm_gtfs_trips,
+    gtfs_time_to_seconds,
+    pack_stop_times,
+)
+
+# Bytes of stop_times.txt handed to a worker at a time
+STOP_TIMES_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def _line_start_at_or_after(f, offset):
+    """Offset of the first line starting at or after `offset`."""
+    if offset == 0:
+        return 0
+    f.seek(offset - 1)
+    f.readline()  # finish the line that contains offset - 1
+    return f.tell()
+
+
+def split_stop_times(filepath, chunk_bytes=STOP_TIMES_CHUNK_BYTES):
+    """
+    Read the header of stop_times.txt and split the rest of the file into
+    (start, end) byte ranges that begin and end on line boundaries.
+    Returns (header columns, ranges).
+    """
+    size = os.path.getsize(filepath)
+    with open(filepath, "rb") as f:
+        header_line = f.readline()
+        data_start = f.tell()
+        header = next(csv.reader([header_line.decode("utf-8-sig")]), [])
+        bounds = [data_start]
+        offset = data_start + chunk_bytes
+        while offset < size:
+            start = _line_start_at_or_after(f, offset)
+            if start >= size:
+                break
+            if start > bounds[-1]:
+                bounds.append(start)
+            offset = start + chunk_bytes
+        bounds.append(size)
+    return header, list(zip(bounds[:-1], bounds[1:]))
+
+
+def parse_stop_times_range(filepath, start, end, columns, stop_ids=None):
+    """
+    Parse the stop_times rows in [start, end) into a PackedStopTimes,
+    keeping only stop_ids if given.
+    """
+    trip_col, stop_col, arrival_col = columns
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    def rows():
+        for row in csv.reader(data.decode("utf-8").splitlines()):
+            if not row:
+                continue
+            stop_id = row[stop_col]
+            if stop_ids is not None and stop_id not in stop_ids:
+                continue
+            try:
+                yield row[trip_col], stop_id, gtfs_time_to_seconds(row[arrival_col])
+            except (ValueError, IndexError):
+                continue
+
+    return pack_stop_times(rows())
+
+
+def load_gtfs_tables_parallel(gtfs_dir, route_ids=None, stop_ids=None, workers=None):
+    """
+    Parallel equivalent of load_stm_routes + load_stm_gtfs_trips +
+    load_stm_stop_times. Returns (routes_map, trips, stop_times).
+    """
+    workers = workers or os.cpu_count() or 1
+    routes_map = load_stm_routes(os.path.join(gtfs_dir, "routes.txt"))  # a few hundred rows
+
+    stop_times_fp = os.path.join(gtfs_dir, "stop_times.txt")
+    header, ranges = split_stop_times(stop_times_fp)
+    if not header:
+        columns = None
+    else:
+        columns = (header.index("trip_id"), header.index("stop_id"), header.index("arrival_time"))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        trips_future = pool.submit(
+            load_stm_gtfs_trips, os.path.join(gtfs_dir, "trips.txt"), routes_map, route_ids
+        )
+        chunk_futures = [
+            pool.submit(parse_stop_times_range, stop_times_fp, start, end, columns, stop_ids)
+            for (start, end) in ranges
+        ] if columns else []
+
+        trips = trips_future.result()
+        keep_trips = set(trips) if route_ids is not None else None
+        chunks = [future.result() for future in chunk_futures]
+
+    stop_times = pack_stop_times(
+        row
+        for chunk in chunks
+        for row in chunk.rows()
+        if keep_trips is None or row[0] in keep_trips
+    )
+    return routes_map, trips, stop_times
@@ -0,0 +1,109 @@
+"""
+Shared HTTP Transport
+Pooled keep-alive sessions for the STM and WeatherAPI endpoints, with
+configurable timeouts, concurrent fan-out and per-endpoint latency metrics.
+"""
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+
+logger = logging.getLogger('BdeB-GTFS')
+
+_session = None
+_session_lock = threading.Lock()
+
+# Fan-out pool for fetching the STM feeds in parallel
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="stm-fetch")
+
+# endpoint name -> latency/status counters
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide keep-alive session (TLS connections are reused)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _record(name, elapsed, status):
+    with _metrics_lock:
+        m = _metrics.setdefault(name, {
+            "count": 0,
+            "errors": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "last_ms": 0.0,
+            "last_status": None,
+        })
+        ms = elapsed * 1000
+        m["count"] += 1
+        m["total_ms"] += ms
+        m["max_ms"] = max(m["max_ms"], ms)
+        m["last_ms"] = ms
+        m["last_status"] = status
+        if status is None or status >= 400:
+            m["errors"] += 1
+
+
+def http_get(name, url, headers=None, timeout=None):
+    """
+    GET through the shared session, recording latency under `name`.
+    Raises like requests.get() on connection errors and timeouts.
+    """
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    started = time.monotonic()
+    status = None
+    try:
+        response = get_session().get(url, headers=headers, timeout=timeout)
+        status = response.status_code
+        return response
+    finally:
+        _record(name, time.monotonic() - started, status)
+
+
+def get_http_metrics():
+    """Per-endpoint latency metrics (count, errors, avg/max/last ms, last status)."""
+    with _metrics_lock:
+        return {
+            name: {
+                "count": m["count"],
+                "errors": m["errors"],
+                "avg_ms": round(m["total_ms"] / m["count"], 1) if m["count"] else 0.0,
+                "max_ms": round(m["max_ms"], 1),
+                "last_ms": round(m["last_ms"], 1),
+                "last_status": m["last_status"],
+            }
+            for name, m in _metrics.items()
+        }
+
+
+def fetch_concurrently(tasks):
+    """
+    Run a dict of name -> zero-argument callable in parallel.
+    Returns name -> result, with None for tasks that raised.
+    """
+    futures = {name: _executor.submit(fn) for name, fn in tasks.items()}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            logger.error(f"[HTTP] {name} fetch failed: {e}")
+            results[name] = None
+    return results
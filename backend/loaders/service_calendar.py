@@ -0,0 +1,121 @@
+"""
+GTFS Service Calendar
+Resolves which service_ids run on a given day from calendar.txt and
+calendar_dates.txt. The active set is computed once per service day, so
+checking whether a trip runs is a set membership test.
+"""
+import os
+import csv
+from datetime import date, datetime
+
+WEEKDAY_COLUMNS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Number of distinct days kept in the active-set memo
+_MAX_CACHED_DAYS = 8
+
+
+def _parse_gtfs_date(value):
+    return datetime.strptime(value.strip(), "%Y%m%d").date().toordinal()
+
+
+class ServiceCalendar:
+    """
+    Precomputed service calendar.
+
+    Dates are parsed once at load time into ordinals; active_services(day)
+    applies calendar.txt ranges and calendar_dates.txt exceptions and
+    memoizes the result per day.
+    """
+
+    def __init__(self, calendar_rows, calendar_dates_rows):
+        # service_id -> (start_ordinal, end_ordinal, weekday flags)
+        self._ranges = {}
+        for row in calendar_rows:
+            try:
+                self._ranges[row["service_id"]] = (
+                    _parse_gtfs_date(row["start_date"]),
+                    _parse_gtfs_date(row["end_date"]),
+                    tuple(row.get(day, "0") == "1" for day in WEEKDAY_COLUMNS),
+                )
+            except (KeyError, ValueError) as e:
+                print(f"Error parsing calendar row for service_id {row.get('service_id')}: {e}")
+
+        # date ordinal -> (added service_ids, removed service_ids)
+        self._exceptions = {}
+        for row in calendar_dates_rows:
+            try:
+                day = _parse_gtfs_date(row["date"])
+            except (KeyError, ValueError) as e:
+                print(f"Error parsing calendar_dates row for service_id {row.get('service_id')}: {e}")
+                continue
+            added, removed = self._exceptions.setdefault(day, (set(), set()))
+            # exception_type "1" means added service, "2" means removed service.
+            if row.get("exception_type") == "1":
+                added.add(row["service_id"])
+            elif row.get("exception_type") == "2":
+                removed.add(row["service_id"])
+
+        self._active_by_day = {}
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def active_services(self, day=None):
+        """Return the frozenset of service_ids running on `day` (default: today)."""
+        if day is None:
+            day = date.today()
+        ordinal = day.toordinal()
+        active = self._active_by_day.get(ordinal)
+        if active is not None:
+            return active
+
+        weekday = day.weekday()  # Monday=0, Sunday=6
+        running = {
+            service_id
+            for service_id, (start, end, days) in self._ranges.items()
+            if start <= ordinal <= end and days[weekday]
+        }
+        added, removed = self._exceptions.get(ordinal, ((), ()))
+        running.difference_update(removed)
+        running.update(added)
+        active = frozenset(running)
+
+        if len(self._active_by_day) >= _MAX_CACHED_DAYS:
+            self._active_by_day.clear()
+        self._active_by_day[ordinal] = active
+        return active
+
+    def runs_on(self, service_id, day=None):
+        """True if service_id runs on `day` (default: today)."""
+        return service_id in self.active_services(day)
+
+
+def _read_csv_rows(path):
+    with open(path, mode="r", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def load_service_calendar(gtfs_dir):
+    """
+    Load calendar.txt / calendar_dates.txt from gtfs_dir.
+    Returns None when neither file exists (service filtering is then skipped).
+    """
+    cal_path = os.path.join(gtfs_dir, "calendar.txt")
+    cal_dates_path = os.path.join(gtfs_dir, "calendar_dates.txt")
+    if not os.path.isfile(cal_path) and not os.path.isfile(cal_dates_path):
+        return None
+
+    calendar_rows = []
+    calendar_dates_rows = []
+    try:
+        if os.path.isfile(cal_path):
+            calendar_rows = _read_csv_rows(cal_path)
+    except Exception as e:
+        print("Error loading calendar.txt:", e)
+    try:
+        if os.path.isfile(cal_dates_path):
+            calendar_dates_rows = _read_csv_rows(cal_dates_path)
+    except Exception as e:
+        print("Error loading calendar_dates.txt:", e)
+
+    return ServiceCalendar(calendar_rows, calendar_dates_rows)
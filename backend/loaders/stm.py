@@ -1,8 +1,11 @@
-import requests
 import os
 import csv
 import time
-from datetime import datetime, timedelta
+import logging
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
 from google.transit import gtfs_realtime_pb2
 from backend.config import (
     STM_API_KEY,
@@ -12,126 +15,139 @@ from backend.config import (
     BUS_ROUTES,
     BUS_STOP_IDS,
     BUS_ROUTE_COMBOS,
-    BUS_DISPLAY_INFO
+    BUS_DISPLAY_INFO,
+    BUS_UPCOMING_DEPARTURES,
+    GTFS_FILTERED_LOAD,
+    GTFS_EXTRA_ROUTES,
+    GTFS_EXTRA_STOP_IDS
 )
 from backend.utils import load_csv_dict  
-# Cache for calendar data
-_calendar_data = None
-_calendar_dates_data = None
+from backend.loaders.service_calendar import load_service_calendar
+from backend.loaders.http_client import http_get
+from backend.records import Bus
 
 IS_DEV_MODE = os.environ.get('ENVIRONMENT') == 'development'
 
+logger = logging.getLogger('BdeB-GTFS')
+
 
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
+STM_GTFS_DIR = os.path.join(os.path.dirname(script_dir), "GTFS", "stm")
+
+# Service calendar (calendar.txt / calendar_dates.txt), loaded on first use
+_service_calendar = {
+    "loaded":   False,
+    "calendar": None,
+}
 
-def load_calendar_data():
-    global _calendar_data
-    if _calendar_data is None:
-        cal_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "STM", "calendar.txt")
-        _calendar_data = {}
-        try:
-            with open(cal_path, mode="r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    service_id = row["service_id"]
-                    _calendar_data[service_id] = row
-        except Exception as e:
-            print("Error loading calendar.txt:", e)
-    return _calendar_data
-
-def load_calendar_dates_data():
-    global _calendar_dates_data
-    if _calendar_dates_data is None:
-        cal_dates_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "STM", "calendar_dates.txt")
-        _calendar_dates_data = {}
-        try:
-            with open(cal_dates_path, mode="r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    service_id = row["service_id"]
-                    if service_id not in _calendar_dates_data:
-                        _calendar_dates_data[service_id] = []
-                    _calendar_dates_data[service_id].append(row)
-        except Exception as e:
-            print("Error loading calendar_dates.txt:", e)
-    return _calendar_dates_data
+def get_service_calendar():
+    """Return the STM ServiceCalendar, or None if no calendar files exist."""
+    if not _service_calendar["loaded"]:
+        _service_calendar["calendar"] = load_service_calendar(STM_GTFS_DIR)
+        _service_calendar["loaded"] = True
+    return _service_calendar["calendar"]
 
 def serviceRunsToday(service_id):
-    today = datetime.now().date()
-    run_today = False
-
-    cal_data = load_calendar_data()
-    cal_dates = load_calendar_dates_data()
-
-    # Check the regular calendar
-    if service_id in cal_data:
-        row = cal_data[service_id]
-        try:
-            start_date = datetime.strptime(row["start_date"], "%Y%m%d").date()
-            end_date = datetime.strptime(row["end_date"], "%Y%m%d").date()
-        except Exception as e:
-            print(f"Error parsing dates for service_id {service_id}: {e}")
-            return False
-        weekday = today.weekday()  # Monday=0, Sunday=6
-        days = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
-        if start_date <= today <= end_date and row[days[weekday]] == "1":
-            run_today = True
-    else:
-        print(f"Service_id {service_id} not found in calendar.txt")
+    calendar = get_service_calendar()
+    if calendar is None:
+        return False
+    return calendar.runs_on(service_id)
 
-    # Apply exceptions from calendar_dates.txt
-    if service_id in cal_dates:
-        for row in cal_dates[service_id]:
-            try:
-                exception_date = datetime.strptime(row["date"], "%Y%m%d").date()
-            except Exception as e:
-                print(f"Error parsing exception date for service_id {service_id}: {e}")
-                continue
-            if exception_date == today:
-                # exception_type "1" means added service, "2" means removed service.
-                if row["exception_type"] == "2":
-                    run_today = False
-                elif row["exception_type"] == "1":
-                    run_today = True
-    return run_today
+# Last response of each GTFS-RT feed, used for conditional requests and to
+# skip re-parsing a feed whose header timestamp has not moved
+_gtfs_rt_feeds = {
+    name: {
+        "etag":          None,
+        "last_modified": None,
+        "timestamp":     None,  # FeedHeader.timestamp of the cached entities
+        "entities":      None,
+        "version":       0,     # incremented whenever new entities are parsed
+    }
+    for name in ("stm_trip_updates", "stm_vehicle_positions")
+}
 
-def fetch_stm_realtime_data():
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
 
-    if IS_DEV_MODE:
-        from backend.mock_stm_data import get_mock_trip_entities
-        return get_mock_trip_entities()
+def _peek_feed_timestamp(content):
+    """
+    Read FeedHeader.timestamp without parsing the whole FeedMessage.
+    The header is field 1 and serialized first; returns None otherwise.
+    """
+    try:
+        if not content or content[0] != 0x0A:  # field 1, length-delimited
+            return None
+        length, pos = _read_varint(content, 1)
+        header = gtfs_realtime_pb2.FeedHeader()
+        header.ParseFromString(content[pos:pos + length])
+        return header.timestamp if header.HasField("timestamp") else None
+    except Exception:
+        return None
+
+def _fetch_gtfs_rt_feed(name, endpoint):
+    """
+    Fetch a GTFS-RT feed with If-None-Match / If-Modified-Since.
+    Returns the cached entities when the server answers 304 or the feed
+    header timestamp is unchanged, parsing only when the feed moved.
+    """
+    state = _gtfs_rt_feeds[name]
     headers = {
         "accept": "application/x-protobuf",
         "apiKey": STM_API_KEY,
     }
-    response = requests.get(STM_REALTIME_ENDPOINT, headers=headers)
-    if response.status_code == 200:
-        print("API Fetch Success")
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-        return feed.entity
-    else:
-        print(f"API Error: {response.status_code} - {response.text}")
+    if state["entities"] is not None:
+        if state["etag"]:
+            headers["If-None-Match"] = state["etag"]
+        if state["last_modified"]:
+            headers["If-Modified-Since"] = state["last_modified"]
+
+    response = http_get(name, endpoint, headers=headers)
+    if response.status_code == 304 and state["entities"] is not None:
+        return state["entities"]
+    if response.status_code != 200:
+        logger.error(f"API Error: {response.status_code} - {response.text}")
         return []
+
+    state["etag"] = response.headers.get("ETag")
+    state["last_modified"] = response.headers.get("Last-Modified")
+
+    content = response.content
+    feed_ts = _peek_feed_timestamp(content)
+    if feed_ts and feed_ts == state["timestamp"] and state["entities"] is not None:
+        return state["entities"]
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(content)
+    state["timestamp"] = feed.header.timestamp if feed.header.HasField("timestamp") else None
+    state["entities"] = feed.entity
+    state["version"] += 1
+    return feed.entity
+
+def get_gtfs_rt_feed_version(name):
+    """Version counter of a GTFS-RT feed; unchanged means the entities are the same."""
+    return _gtfs_rt_feeds[name]["version"]
+
+def fetch_stm_realtime_data():
+
+    if IS_DEV_MODE:
+        from backend.mock_stm_data import get_mock_trip_entities
+        return get_mock_trip_entities()
+    return _fetch_gtfs_rt_feed("stm_trip_updates", STM_REALTIME_ENDPOINT)
     
 def fetch_stm_vehicle_positions():
     if IS_DEV_MODE:
         from backend.mock_stm_data import get_mock_vehicle_positions
         return get_mock_vehicle_positions()
-    headers = {
-        "accept": "application/x-protobuf",
-        "apiKey": STM_API_KEY,
-    }
-    response = requests.get(STM_VEHICLE_POSITIONS_ENDPOINT, headers=headers)
-    if response.status_code == 200:
-        print("Vehicle Positions Fetch Success")
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-        return feed.entity
-    else:
-        print(f"API Error: {response.status_code} - {response.text}")
-        return []   
+    return _fetch_gtfs_rt_feed("stm_vehicle_positions", STM_VEHICLE_POSITIONS_ENDPOINT)
 
 
 # Cache for STM alerts to avoid rate limits
@@ -152,18 +168,18 @@ def fetch_stm_alerts():
     current_time = time.time()
     if current_time - _stm_alerts_cache["timestamp"] < STM_ALERTS_CACHE_TTL:
         if _stm_alerts_cache["data"] is not None:
-            print(f"[CACHE] Using cached STM alerts (age: {int(current_time - _stm_alerts_cache['timestamp'])}s)")
+            logger.debug(f"[CACHE] Using cached STM alerts (age: {int(current_time - _stm_alerts_cache['timestamp'])}s)")
             return _stm_alerts_cache["data"]
     
     # Cache expired or empty, fetch fresh data
-    print("[API] Fetching fresh STM alerts from API...")
+    logger.debug("[API] Fetching fresh STM alerts from API...")
     
     headers = {
         "accept": "application/json",
         "apiKey": STM_API_KEY,
     }
     try:
-        response = requests.get(STM_ALERTS_ENDPOINT, headers=headers)
+        response = http_get("stm_alerts", STM_ALERTS_ENDPOINT, headers=headers)
         if response.status_code == 200:
             json_data = response.json()
             
@@ -226,16 +242,14 @@ def fetch_stm_alerts():
                 _stm_alerts_cache["timestamp"] = current_time
                 return normalized
             else:
-                print(f"Unexpected STM alerts response format: {type(json_data)}")
+                logger.warning(f"Unexpected STM alerts response format: {type(json_data)}")
                 return _stm_alerts_cache["data"] or []
         else:
-            print(f"[ERROR] STM API Error: {response.status_code} - {response.text}")
+            logger.error(f"[ERROR] STM API Error: {response.status_code} - {response.text}")
             # Return cached data if available even if stale
             return _stm_alerts_cache["data"] or []
     except Exception as e:
-        print(f"[ERROR] Error fetching alerts: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"[ERROR] Error fetching alerts: {str(e)}", exc_info=True)
         # Return cached data if available even if stale
         return _stm_alerts_cache["data"] or []
 
@@ -499,16 +513,156 @@ def load_stm_routes(routes_file):
             routes_data[real_id] = short_name
     return routes_data
 
-def load_stm_stop_times(filepath):
-    stop_times = {}
-    with open(filepath, mode="r", encoding="utf-8-sig") as file:
-        reader = csv.DictReader(file)
+def get_gtfs_load_filter():
+    """
+    Return (route_ids, stop_ids) to keep when loading static GTFS, or
+    (None, None) when filtered loading is disabled.
+    """
+    if not GTFS_FILTERED_LOAD:
+        return None, None
+    route_ids = set(BUS_ROUTES) | set(GTFS_EXTRA_ROUTES)
+    stop_ids = set(BUS_STOP_IDS) | set(GTFS_EXTRA_STOP_IDS)
+    return route_ids, stop_ids
+
+class PackedStopTimes:
+    """
+    Read-only (trip_id, stop_id) -> "HH:MM:SS" mapping backed by int32
+    columns. Trip and stop ids are stored once and referenced by index;
+    rows are sorted by trip so a lookup is a bisect plus a short scan over
+    that trip's stops. No per-row Python objects are kept.
+    """
+    __slots__ = ("_trip_ids", "_stop_ids", "_trip_index", "_trip_col", "_stop_col", "_arrival_col")
+
+    def __init__(self, trip_ids, stop_ids, trip_col, stop_col, arrival_col, trip_index=None):
+        self._trip_ids = trip_ids
+        self._stop_ids = stop_ids
+        if trip_index is None:
+            trip_index = {trip_id: i for i, trip_id in enumerate(trip_ids)}
+        self._trip_index = trip_index
+        self._trip_col = trip_col
+        self._stop_col = stop_col
+        self._arrival_col = arrival_col
+
+    def __len__(self):
+        return len(self._trip_col)
+
+    def get(self, key, default=None):
+        seconds = self.get_seconds(key)
+        return default if seconds is None else format_gtfs_time(seconds)
+
+    def get_seconds(self, key):
+        """Arrival of (trip_id, stop_id) as GTFS seconds since midnight, or None."""
+        trip_id, stop_id = key
+        t = self._trip_index.get(trip_id)
+        if t is None:
+            return None
+        trip_col = self._trip_col
+        n = len(trip_col)
+        i = bisect_left(trip_col, t)
+        while i < n and trip_col[i] == t:
+            if self._stop_ids[self._stop_col[i]] == stop_id:
+                return self._arrival_col[i]
+            i += 1
+        return None
+
+    def rows(self):
+        """Yield (trip_id, stop_id, arrival seconds) in storage order."""
+        trip_ids = self._trip_ids
+        stop_ids = self._stop_ids
+        for t, s, a in zip(self._trip_col, self._stop_col, self._arrival_col):
+            yield trip_ids[t], stop_ids[s], a
+
+    def items(self):
+        for trip_id, stop_id, a in self.rows():
+            yield (trip_id, stop_id), format_gtfs_time(a)
+
+def pack_stop_times(rows):
+    """
+    Build a PackedStopTimes from (trip_id, stop_id, arrival seconds) rows.
+    As with a dict, a later row for the same (trip_id, stop_id) wins.
+    """
+    trip_index = {}
+    stop_index = {}
+    trip_col = array("i")
+    stop_col = array("i")
+    arrival_col = array("i")
+    for trip_id, stop_id, arrival in rows:
+        t = trip_index.get(trip_id)
+        if t is None:
+            t = trip_index[trip_id] = len(trip_index)
+        s = stop_index.get(stop_id)
+        if s is None:
+            s = stop_index[stop_id] = len(stop_index)
+        trip_col.append(t)
+        stop_col.append(s)
+        arrival_col.append(arrival)
+
+    # stop_times.txt is normally grouped by trip already; sort only if not
+    n = len(trip_col)
+    if all(trip_col[i - 1] <= trip_col[i] for i in range(1, n)):
+        order = range(n)
+    else:
+        order = sorted(range(n), key=trip_col.__getitem__)
+
+    # Keep the last row per (trip, stop), in the order each pair first appeared
+    packed = (array("i"), array("i"), array("i"))
+    run = {}
+    run_trip = None
+    for i in order:
+        t = trip_col[i]
+        if t != run_trip:
+            for s, a in run.items():
+                packed[0].append(run_trip)
+                packed[1].append(s)
+                packed[2].append(a)
+            run.clear()
+            run_trip = t
+        run[stop_col[i]] = arrival_col[i]
+    for s, a in run.items():
+        packed[0].append(run_trip)
+        packed[1].append(s)
+        packed[2].append(a)
+
+    return PackedStopTimes(list(trip_index), list(stop_index), *packed, trip_index=trip_index)
+
+def load_stm_stop_times(filepath, stop_ids=None, trip_ids=None):
+    """
+    Stream stop_times.txt into a PackedStopTimes mapping
+    (trip_id, stop_id) -> arrival_time ("HH:MM:SS").
+    When stop_ids/trip_ids are given, only matching rows are kept.
+    """
+    return pack_stop_times(iter_stm_stop_times(filepath, stop_ids, trip_ids))
+
+def iter_stm_stop_times(filepath, stop_ids=None, trip_ids=None):
+    """Yield (trip_id, stop_id, arrival seconds) for the matching rows of stop_times.txt."""
+    with open(filepath, mode="r", encoding="utf-8-sig", newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if not header:
+            return
+        trip_col = header.index("trip_id")
+        stop_col = header.index("stop_id")
+        arrival_col = header.index("arrival_time")
         for row in reader:
-            key = (row["trip_id"], row["stop_id"])
-            stop_times[key] = row["arrival_time"]
-    return stop_times
+            if not row:
+                continue
+            stop_id = row[stop_col]
+            if stop_ids is not None and stop_id not in stop_ids:
+                continue
+            trip_id = row[trip_col]
+            if trip_ids is not None and trip_id not in trip_ids:
+                continue
+            try:
+                arrival = gtfs_time_to_seconds(row[arrival_col])
+            except (ValueError, IndexError):
+                continue
+            yield trip_id, stop_id, arrival
 
-def load_stm_gtfs_trips(filepath, routes_map):
+def load_stm_gtfs_trips(filepath, routes_map, route_ids=None):
+    """
+    Load trips.txt into trip_id -> {route_id (short name), wheelchair_accessible, service_id}.
+    When route_ids (short names) is given, only trips on those routes are kept.
+    """
     trips_data = {}
     with open(filepath, mode="r", encoding="utf-8-sig") as file:
         reader = csv.DictReader(file)
@@ -517,13 +671,147 @@ def load_stm_gtfs_trips(filepath, routes_map):
             real_route_id = row["route_id"]  
             # Convert real_route_id -> short_name
             short_name = routes_map.get(real_route_id, real_route_id)
+            if route_ids is not None and short_name not in route_ids:
+                continue
             w_str = row.get("wheelchair_accessible", "0")
             trips_data[trip_id] = {
                 "route_id": short_name, 
-                "wheelchair_accessible": w_str
+                "wheelchair_accessible": w_str,
+                "service_id": row.get("service_id", "")
             }
     return trips_data
 
+def gtfs_time_to_seconds(time_str):
+    """
+    Convert a GTFS "HH:MM:SS" time to seconds since midnight.
+    Hours may exceed 23 for trips running past midnight.
+    """
+    parts = time_str.split(":")
+    hours = int(parts[0])
+    mins  = int(parts[1])
+    secs  = int(parts[2]) if len(parts) > 2 else 0
+    return hours * 3600 + mins * 60 + secs
+
+def format_gtfs_time(seconds):
+    """Convert seconds since midnight back to a GTFS "HH:MM:SS" string."""
+    return "%02d:%02d:%02d" % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+def build_stm_stop_time_index(stm_trips, stm_stop_times, desired_combos=BUS_ROUTE_COMBOS):
+    """
+    Precompute scheduled times for each configured (route, stop) combo.
+
+    Returns a dict of (route_short_name, stop_id) -> (times, service_ids)
+    where times is a sorted list of GTFS seconds since midnight (may exceed
+    86400 for trips past midnight) and service_ids is the parallel list of
+    each trip's service_id. The next scheduled departure is then a bisect
+    instead of a scan over every stop_time.
+    """
+    wanted = {(route, stop) for (route, stop, _) in desired_combos}
+    wanted_stops = {stop for (_, stop) in wanted}
+    rows = {combo: [] for combo in wanted}
+
+    for trip_id, stop_id, sched in stm_stop_times.rows():
+        if stop_id not in wanted_stops:
+            continue
+        trip_info = stm_trips.get(trip_id)
+        if not trip_info:
+            continue
+        combo_rows = rows.get((trip_info["route_id"], stop_id))
+        if combo_rows is None:
+            continue
+        combo_rows.append((sched, trip_info.get("service_id", "")))
+
+    index = {}
+    for combo, combo_rows in rows.items():
+        combo_rows.sort()
+        index[combo] = (
+            [sched for (sched, _) in combo_rows],
+            [service_id for (_, service_id) in combo_rows],
+        )
+    return index
+
+def _first_running_after(times, service_ids, threshold, active):
+    """First scheduled time > threshold whose service is active (None if active is None)."""
+    for i in range(bisect_right(times, threshold), len(times)):
+        if active is None or service_ids[i] in active:
+            return times[i]
+    return None
+
+def next_scheduled_seconds(stop_time_index, route_id, stop_id, now, service_calendar=None):
+    """
+    Return the next scheduled departure for a combo as seconds from today's
+    midnight (values >= 86400 fall on a later day), or None if there is none.
+
+    With a service_calendar, only trips whose service runs on their service
+    day are considered: yesterday's trips still running past midnight,
+    today's trips, then tomorrow's first trip.
+    """
+    entry = stop_time_index.get((route_id, stop_id))
+    if not entry or not entry[0]:
+        return None
+    times, service_ids = entry
+    today = now.date()
+    now_seconds = now.hour * 3600 + now.minute * 60 + now.second
+
+    def active_on(days_offset):
+        if service_calendar is None:
+            return None
+        return service_calendar.active_services(date.fromordinal(today.toordinal() + days_offset))
+
+    candidates = []
+    # Yesterday's service day, times past 24:00:00
+    sched = _first_running_after(times, service_ids, now_seconds + 86400, active_on(-1))
+    if sched is not None:
+        candidates.append(sched - 86400)
+    # Today's service day
+    sched = _first_running_after(times, service_ids, now_seconds, active_on(0))
+    if sched is not None:
+        candidates.append(sched)
+    if candidates:
+        return min(candidates)
+
+    # Nothing left today, first departure of tomorrow's service day
+    sched = _first_running_after(times, service_ids, -1, active_on(1))
+    if sched is not None:
+        return sched + 86400
+    return None
+
+def build_stm_scheduled_seconds(stm_trips, stm_stop_times, desired_combos=BUS_ROUTE_COMBOS):
+    """
+    Scheduled arrival of every trip at the configured stops, as
+    (trip_id, stop_id) -> GTFS seconds since midnight, read straight from
+    the PackedStopTimes columns so delay checks never parse "HH:MM:SS".
+    """
+    wanted = {(route, stop) for (route, stop, _) in desired_combos}
+    wanted_stops = {stop for (_, stop) in wanted}
+    scheduled = {}
+    for trip_id, stop_id, sched in stm_stop_times.rows():
+        if stop_id not in wanted_stops:
+            continue
+        trip_info = stm_trips.get(trip_id)
+        if not trip_info or (trip_info["route_id"], stop_id) not in wanted:
+            continue
+        scheduled[(trip_id, stop_id)] = sched
+    return scheduled
+
+# Deviation from the schedule needed before a bus is shown late or early
+SCHEDULE_DEVIATION_SECONDS = 60
+
+def compute_schedule_deviations(arrivals, scheduled, midnight_ts):
+    """
+    Batched predicted-minus-scheduled deviation in seconds.
+
+    arrivals are predicted unix times, scheduled the parallel GTFS seconds
+    (-1 when unknown) relative to midnight_ts. Each schedule is resolved to
+    the service day nearest its prediction, so trips past midnight (24:xx:xx)
+    and buses running across midnight compare correctly. Returns an
+    array('q') with 0 where the schedule is unknown.
+    """
+    return array("q", (
+        (arrival - midnight_ts - sched + 43200) % 86400 - 43200 if sched >= 0 else 0
+        for arrival, sched in zip(arrivals, scheduled)
+    ))
+
 def stm_map_occupancy_status(status):
     """
     Map GTFS-RT occupancy status to human-readable format
@@ -545,7 +833,14 @@ def validate_trip(trip_id, route_id, gtfs_trips):
     return trip_info["route_id"] == route_id
 
 
-def fetch_stm_positions_dict(desired_routes, stm_trips, routes_map=None):
+# Positions extracted from the last vehicle positions feed version
+_positions_memo = {
+    "key":  None,
+    "data": None,
+}
+
+def fetch_stm_positions_dict(desired_routes, stm_trips, routes_map=None, trip_ids=None, entities=None,
+                             dataset_version=None):
     """
     Fetch vehicle positions and extract occupancy data
     
@@ -553,27 +848,48 @@ def fetch_stm_positions_dict(desired_routes, stm_trips, routes_map=None):
         desired_routes: List of short route names like ["36", "61"]
         stm_trips: Dictionary of trip data
         routes_map: Dictionary mapping GTFS route_id to short names (REQUIRED for occupancy)
+        trip_ids: Only index these trips (see get_matched_trip_ids); None keeps every trip
+        entities: Vehicle position entities already fetched; fetched when None
+        dataset_version: Version of the GTFS dataset stm_trips/routes_map come
+            from; the result is only reused for the same version (None: never)
     """
     positions = {}
-    entities = fetch_stm_vehicle_positions()
+    if entities is None:
+        entities = fetch_stm_vehicle_positions()
     if not entities:
-        print("[OCCUPANCY] No vehicle position entities returned from API")
+        logger.warning("[OCCUPANCY] No vehicle position entities returned from API")
         return positions 
+
+    # Same feed and same inputs as last cycle: reuse the extracted positions
+    memo_key = (
+        get_gtfs_rt_feed_version("stm_vehicle_positions"),
+        tuple(desired_routes), dataset_version,
+        frozenset(trip_ids) if trip_ids is not None else None
+    )
+    if not IS_DEV_MODE and dataset_version is not None and _positions_memo["key"] == memo_key:
+        return _positions_memo["data"]
     
-    print(f"[OCCUPANCY] Processing {len(entities)} vehicle position entities...")
+    if trip_ids is None:
+        logger.debug(f"[OCCUPANCY] Processing {len(entities)} vehicle position entities...")
     
     for entity in entities:
         if entity.HasField("vehicle"):
             vehicle = entity.vehicle
-            gtfs_route_id = vehicle.trip.route_id  # This is the internal GTFS ID
             trip_id = vehicle.trip.trip_id
+            # Vehicles not serving one of our upcoming trips are skipped first
+            if trip_ids is not None and trip_id not in trip_ids:
+                continue
+            gtfs_route_id = vehicle.trip.route_id  # This is the internal GTFS ID
             
             # Convert GTFS route_id to short name
             if routes_map:
                 short_route_id = routes_map.get(gtfs_route_id, gtfs_route_id)
             else:
                 short_route_id = gtfs_route_id
-                print(f"[OCCUPANCY] WARNING: No routes_map provided, using raw route_id: {gtfs_route_id}")
+                logger.warning(
+                    f"[OCCUPANCY] No routes_map provided, using raw route_id: {gtfs_route_id}",
+                    extra={"sample_every": 500}
+                )
 
             # Only store if it's a route/trip we care about
             if short_route_id in desired_routes:
@@ -590,7 +906,7 @@ def fetch_stm_positions_dict(desired_routes, stm_trips, routes_map=None):
                 occupancy_raw = None
                 if vehicle.HasField("occupancy_status"):
                     occupancy_raw = vehicle.occupancy_status
-                    print(f"[OCCUPANCY] Found occupancy for route {short_route_id}, trip {trip_id}: {occupancy_raw}")
+                    logger.debug(f"[OCCUPANCY] Found occupancy for route {short_route_id}, trip {trip_id}: {occupancy_raw}")
                 
                 feed_stop_id = vehicle.stop_id if vehicle.HasField("stop_id") else None
 
@@ -607,23 +923,100 @@ def fetch_stm_positions_dict(desired_routes, stm_trips, routes_map=None):
                     "stop_id": feed_stop_id,
                     "current_status": current_status_str
                 }
-                print(f"[OCCUPANCY] Stored position for route {short_route_id}, trip {trip_id}")
+                logger.debug(f"[OCCUPANCY] Stored position for route {short_route_id}, trip {trip_id}")
     
-    print(f"[OCCUPANCY] Total positions stored: {len(positions)}")
+    logger.debug(f"[OCCUPANCY] Total positions stored: {len(positions)}")
+    _positions_memo["key"] = memo_key
+    _positions_memo["data"] = positions
     return positions
 
+# Dispatch tables compiled from the last combo list seen
+_compiled_combos = {
+    "combos": None,
+    "table":  None,
+}
+
+def compile_route_combos(desired_combos):
+    """
+    Compile (route, stop, key) combos into a dispatch table.
+    Returns ({(route_id, stop_id): key}, {route_ids}) so matching a
+    stop_time_update is one dict lookup whatever the number of combos.
+    """
+    combos = tuple(desired_combos)
+    if _compiled_combos["combos"] != combos:
+        combo_keys = {}
+        for (route_id, stop_id, key) in combos:
+            # First combo wins, like the original linear scan
+            combo_keys.setdefault((route_id, stop_id), key)
+        _compiled_combos["table"] = (combo_keys, {route_id for (route_id, _) in combo_keys})
+        _compiled_combos["combos"] = combos
+    return _compiled_combos["table"]
+
+def get_matched_trip_ids(trip_entities, desired_combos=BUS_ROUTE_COMBOS):
+    """
+    trip_ids of the trip updates that stop at one of the configured combos,
+    i.e. the only vehicles whose position/occupancy can end up on the board.
+    """
+    combo_keys, combo_routes = compile_route_combos(desired_combos)
+    trip_ids = set()
+    for entity in trip_entities:
+        if not entity.HasField("trip_update"):
+            continue
+        t_update = entity.trip_update
+        route_id = t_update.trip.route_id
+        if route_id not in combo_routes:
+            continue
+        for stop_time in t_update.stop_time_update:
+            if (route_id, stop_time.stop_id) in combo_keys:
+                trip_ids.add(t_update.trip.trip_id)
+                break
+    return trip_ids
+
 def process_stm_trip_updates(
     trip_entities,
     stm_trips,
     stm_stop_times,
     positions_dict,
     desired_combos=BUS_ROUTE_COMBOS,
-    combo_info=BUS_DISPLAY_INFO
+    combo_info=BUS_DISPLAY_INFO,
+    stop_time_index=None,
+    service_calendar=None,
+    upcoming_count=BUS_UPCOMING_DEPARTURES,
+    scheduled_seconds=None,
+    now=None
 ):
     """
     Process STM trip updates and merge with vehicle positions for occupancy data
+
+    stop_time_index comes from build_stm_stop_time_index(); it is built on
+    the fly when not provided. service_calendar limits the schedule fallback
+    to trips running today (defaults to the STM calendar files).
+    scheduled_seconds comes from build_stm_scheduled_seconds(), also built
+    on the fly when not provided.
+
+    now is the local datetime the whole board is computed against
+    (default: datetime.now()); pass a fixed value to replay a feed.
+
+    Each combo keeps its `upcoming_count` nearest realtime arrivals in a
+    bounded heap; the returned bus is the nearest one and carries all of
+    them in "upcoming". Returns a list of records.Bus, in combo order.
     """
     closest_buses = { combo[2]: None for combo in desired_combos }
+    # final_key -> max-heap of (-minutes_to_arrival, seq, Bus), size <= upcoming_count
+    upcoming = { combo[2]: [] for combo in desired_combos }
+    seq = 0
+    combo_keys, combo_routes = compile_route_combos(desired_combos)
+    # One clock reading for every bus in this response
+    if now is None:
+        now = datetime.now()
+    now_ts = now.timestamp()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if scheduled_seconds is None:
+        scheduled_seconds = build_stm_scheduled_seconds(stm_trips, stm_stop_times, desired_combos)
+    # Matched realtime buses; delays are computed for all of them at once
+    matched_buses = []
+    matched_arrivals = array("q")
+    matched_scheduled = array("q")
 
     # Process real-time updates
     for entity in trip_entities:
@@ -632,21 +1025,17 @@ def process_stm_trip_updates(
 
         t_update = entity.trip_update
         route_id = t_update.trip.route_id
-        trip_id  = t_update.trip.trip_id
 
-        if route_id not in BUS_ROUTES:
+        if route_id not in combo_routes:
             continue
 
+        trip_id  = t_update.trip.trip_id
         w_str = stm_trips.get(trip_id, {}).get("wheelchair_accessible", "0")
         wheelchair_accessible = (w_str == "1")
 
         for stop_time in t_update.stop_time_update:
             stop_id = stop_time.stop_id
-            final_key = None
-            for (gtfs_route, wanted_stop, key_name) in desired_combos:
-                if route_id == gtfs_route and stop_id == wanted_stop:
-                    final_key = key_name
-                    break
+            final_key = combo_keys.get((route_id, stop_id))
             if not final_key:
                 continue
 
@@ -658,24 +1047,22 @@ def process_stm_trip_updates(
 
             # Handle skipped/cancelled buses
             if is_skipped:
-                bus_obj = {
-                    "route_id": route_id,
-                    "trip_id": trip_id,
-                    "stop_id": stop_id,
-                    "arrival_time": "Annulé",
-                    "occupancy": "Unknown",
-                    "direction": combo_info[final_key]["direction"],
-                    "location": combo_info[final_key]["location"],
-                    "delayed_text": None,
-                    "early_text": None,
-                    "at_stop": False,
-                    "wheelchair_accessible": wheelchair_accessible,
-                    "cancelled": True,
-                    "service_status": "cancelled" 
-                }
+                bus_obj = Bus(
+                    route_id=route_id,
+                    trip_id=trip_id,
+                    stop_id=stop_id,
+                    arrival_time="Annulé",
+                    occupancy="Unknown",
+                    direction=combo_info[final_key]["direction"],
+                    location=combo_info[final_key]["location"],
+                    wheelchair_accessible=wheelchair_accessible,
+                    cancelled=True,
+                    service_status="cancelled",
+                    upcoming=[]
+                )
                 
-                existing = closest_buses[final_key]
-                if existing is None or not existing.get("cancelled", False):
+                # Only shown when no realtime arrival is left for this combo
+                if closest_buses[final_key] is None:
                     closest_buses[final_key] = bus_obj
                 continue  
 
@@ -684,25 +1071,8 @@ def process_stm_trip_updates(
                 continue
 
             # Calculate minutes until arrival
-            now_ts = time.time()
             minutes_to_arrival = int((arrival_unix - now_ts) // 60)
 
-            # Check for delays
-            scheduled_arrival_str = stm_stop_times.get((trip_id, stop_id))
-            delay_text = None
-            if scheduled_arrival_str:
-                try:
-                    h, m, s = map(int, scheduled_arrival_str.split(":"))
-                    sched_dt = datetime.now().replace(hour=h % 24, minute=m, second=s, microsecond=0)
-                    if sched_dt < datetime.now():
-                        sched_dt += timedelta(days=1)
-
-                    predicted_dt = datetime.fromtimestamp(arrival_unix)
-                    if predicted_dt > sched_dt:
-                        delay_text = f"En retard (planifié à {sched_dt.strftime('%I:%M %p')})"
-                except Exception:
-                    pass
-
             # Get occupancy from positions dict
             pos_info = positions_dict.get((route_id, trip_id), {})
             raw_occ = pos_info.get("occupancy")
@@ -716,82 +1086,86 @@ def process_stm_trip_updates(
             bus_lon = pos_info.get("lon")
             current_status = pos_info.get("current_status")
 
-            bus_obj = {
-                "route_id": route_id,
-                "trip_id": trip_id,
-                "stop_id": stop_id,
-                "arrival_time": minutes_to_arrival,
-                "occupancy": occ_str,  # Use mapped occupancy string
-                "direction": combo_info[final_key]["direction"],
-                "location": combo_info[final_key]["location"],
-                "delayed_text": delay_text,
-                "early_text": None,
-                "at_stop": at_stop_flag,
-                "wheelchair_accessible": wheelchair_accessible,
-                "cancelled": False,
-                "service_status": "normal",
-                "lat": bus_lat,
-                "lon": bus_lon,
-                "current_status": current_status
-            }
+            bus_obj = Bus(
+                route_id=route_id,
+                trip_id=trip_id,
+                stop_id=stop_id,
+                arrival_time=minutes_to_arrival,
+                occupancy=occ_str,  # Use mapped occupancy string
+                direction=combo_info[final_key]["direction"],
+                location=combo_info[final_key]["location"],
+                at_stop=at_stop_flag,
+                wheelchair_accessible=wheelchair_accessible,
+                service_status="normal",
+                lat=bus_lat,
+                lon=bus_lon,
+                current_status=current_status
+            )
+
+            matched_buses.append(bus_obj)
+            matched_arrivals.append(arrival_unix)
+            matched_scheduled.append(scheduled_seconds.get((trip_id, stop_id), -1))
 
-            # Update if this is the closest bus
-            existing = closest_buses[final_key]
-            if existing is None or (
-                (not existing.get("cancelled", False) and not bus_obj["cancelled"]) and
-                isinstance(existing["arrival_time"], (int, float)) and
-                isinstance(minutes_to_arrival, (int, float)) and
-                minutes_to_arrival < existing["arrival_time"]
-            ) or (
-                existing.get("cancelled", False) and not bus_obj["cancelled"]
-            ):
-                closest_buses[final_key] = bus_obj
+            # Keep the K nearest arrivals: the heap root is the farthest kept
+            heap = upcoming[final_key]
+            seq += 1
+            if len(heap) < upcoming_count:
+                heapq.heappush(heap, (-minutes_to_arrival, -seq, bus_obj))
+            elif minutes_to_arrival < -heap[0][0]:
+                heapq.heapreplace(heap, (-minutes_to_arrival, -seq, bus_obj))
+
+    # Late / early status of every matched bus in one batch
+    if matched_buses:
+        deviations = compute_schedule_deviations(matched_arrivals, matched_scheduled, int(midnight.timestamp()))
+        for bus_obj, arrival_unix, deviation in zip(matched_buses, matched_arrivals, deviations):
+            if abs(deviation) < SCHEDULE_DEVIATION_SECONDS:
+                continue
+            sched_str = datetime.fromtimestamp(arrival_unix - deviation).strftime('%I:%M %p')
+            if deviation > 0:
+                bus_obj.delayed_text = f"En retard (planifié à {sched_str})"
+            else:
+                bus_obj.early_text = f"En avance (planifié à {sched_str})"
+
+    # Nearest realtime arrival first, the others in "upcoming"
+    for final_key, heap in upcoming.items():
+        if not heap:
+            continue
+        ordered = [bus for (_, _, bus) in sorted(heap, reverse=True)]
+        closest = ordered[0]
+        closest.upcoming = [bus.upcoming_entry() for bus in ordered]
+        closest_buses[final_key] = closest
 
     # Add fallback buses for routes with no real-time data
-    now = datetime.now()
+    if service_calendar is None:
+        service_calendar = get_service_calendar()
     for (gtfs_route, wanted_stop, final_key) in desired_combos:
         if closest_buses[final_key] is None:
+            if stop_time_index is None:
+                stop_time_index = build_stm_stop_time_index(stm_trips, stm_stop_times, desired_combos)
+
             nextScheduled = None
-            route_trip_ids = {
-                tid for tid, data in stm_trips.items() if data["route_id"] == gtfs_route
-            }
-            for (trip_id, stop_id), schedTimeStr in stm_stop_times.items():
-                if trip_id not in route_trip_ids or stop_id != wanted_stop:
-                    continue
-                try:
-                    parts = schedTimeStr.split(":")
-                    hours = int(parts[0]) % 24
-                    mins  = int(parts[1])
-                    secs  = int(parts[2]) if len(parts) > 2 else 0
-                    schedDt = datetime(now.year, now.month, now.day, hours, mins, secs)
-                    if schedDt <= now:
-                        schedDt += timedelta(days=1)
-                    if nextScheduled is None or schedDt < nextScheduled:
-                        nextScheduled = schedDt
-                except:
-                    continue
+            sched_seconds = next_scheduled_seconds(
+                stop_time_index, gtfs_route, wanted_stop, now, service_calendar
+            )
+            if sched_seconds is not None:
+                nextScheduled = midnight + timedelta(seconds=sched_seconds)
 
             arrival_str = nextScheduled.strftime("%I:%M %p") if nextScheduled else "Indisponible"
-            fallback = {
-                "route_id": gtfs_route,
-                "trip_id": "N/A",
-                "stop_id": wanted_stop,
-                "arrival_time": arrival_str,
-                "occupancy": "Unknown",
-                "direction": combo_info[final_key]["direction"],
-                "location": combo_info[final_key]["location"],
-                "delayed_text": None,
-                "early_text": None,
-                "at_stop": False,
-                "wheelchair_accessible": False,
-                "cancelled": False,
-                "service_status": "scheduled"
-            }
+            fallback = Bus(
+                route_id=gtfs_route,
+                trip_id="N/A",
+                stop_id=wanted_stop,
+                arrival_time=arrival_str,
+                occupancy="Unknown",
+                direction=combo_info[final_key]["direction"],
+                location=combo_info[final_key]["location"],
+                service_status="scheduled",
+                upcoming=[]
+            )
             closest_buses[final_key] = fallback
 
-    # Return buses in predefined order
-    order = ["61_Est","61_Ouest","36_Est","36_Ouest"]
-    return [closest_buses[k] for k in order if closest_buses[k] is not None]
+    # Return buses in the configured combo order
+    return [closest_buses[k] for (_, _, k) in desired_combos if closest_buses[k] is not None]
 
 
 def display_current_alerts():
@@ -1,5 +1,5 @@
 # app.py
-import os, sys, time, json, logging, subprocess, threading, re, requests
+import os, sys, time, json, logging, subprocess, threading
 from datetime import datetime
 from flask_cors import CORS
 from flask import Flask, render_template, request, jsonify, redirect
@@ -11,7 +11,14 @@ except ImportError:
     SUPABASE_AVAILABLE = False
     print("⚠️  Supabase module not installed")
 # ────── PACKAGE IMPORTS ───────────────────────────────────────
-from .config            import WEATHER_API_KEY
+from .config            import (
+    WEATHER_API_KEY,
+    REALTIME_POLL_SECONDS,
+    BUS_ROUTES,
+    SSE_MAX_CLIENTS,
+    SSE_KEEPALIVE_SECONDS,
+    GTFS_WATCH_SECONDS,
+)
 from .utils             import is_service_unavailable
 
 from .loaders.stm       import (
@@ -20,17 +27,32 @@ from .loaders.stm       import (
     fetch_stm_route_specific_alerts, 
     fetch_all_stm_alerts,  
     fetch_stm_realtime_data,
+    fetch_stm_vehicle_positions,
     fetch_stm_positions_dict,
-    load_stm_gtfs_trips,
-    load_stm_stop_times,
-    load_stm_routes,
+    get_matched_trip_ids,
     process_stm_trip_updates,
     stm_map_occupancy_status,
     debug_print_stm_occupancy_status,
     validate_trip,
 )
 
-from .alerts import process_stm_alerts
+from .loaders.http_client import http_get, fetch_concurrently, get_http_metrics
+from .alerts import process_stm_alerts, get_alert_index, get_alert_table
+from .records import BannerAlert, MetroLine
+from .managers.log_setup import setup_logging
+from .managers.gtfs_dataset import (
+    start_gtfs_watcher,
+    get_gtfs_dataset,
+    get_gtfs_dataset_version,
+    request_gtfs_reload,
+)
+from .managers.realtime import (
+    start_realtime_poller,
+    get_or_build_snapshot,
+    get_snapshot,
+    wait_for_change,
+    request_refresh,
+)
 
 # ────────────────────────────────────────────────────────────────
 
@@ -44,7 +66,8 @@ _weather_cache = {
 }
 
 CACHE_TTL = 5 * 60  # seconds (5 minutes)
-logger = logging.getLogger('BdeB-GTFS')
+# Queue-backed leveled logging (LOG_LEVEL=DEBUG for per-bus details)
+logger = setup_logging()
 app = Flask(__name__)
 CORS(app)
 PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -104,40 +127,10 @@ if os.environ.get('ENVIRONMENT') != 'development':
     else:
         print("⚠️  Supabase credentials not set, skipping cloud download")
 
-# ─── check for required GTFS files ────────────────────────────
-required_stm = ["routes.txt", "trips.txt", "stop_times.txt"]
-
-missing = []
-for fname in required_stm:
-    fpath = os.path.join(STM_DIR, fname)
-    if not os.path.isfile(fpath):
-        missing.append(f"stm/{fname}")
-    else:
-        # Print file size to confirm it exists
-        fsize = os.path.getsize(fpath) / 1024
-        print(f"✓ Found {fname} ({fsize:.1f} KB)")
-
-if missing:
-    print("⚠️  Fichiers GTFS manquants:")
-    for m in missing:
-        print(f"   • {m}")
-    print("\nL'application démarre quand même. Téléchargez les fichiers GTFS via l'interface admin.")
-    routes_map = {}
-    stm_trips = {}  # ← FIX: Changed from [] to {}
-    stm_stop_times = {}
-else:
-    # Charger les fichiers 
-    print("📂 Loading GTFS files...")
-    stm_routes_fp = os.path.join(STM_DIR, "routes.txt")
-    stm_trips_fp = os.path.join(STM_DIR, "trips.txt")
-    stm_stop_times_fp = os.path.join(STM_DIR, "stop_times.txt")
-    
-    routes_map = load_stm_routes(stm_routes_fp)
-    stm_trips = load_stm_gtfs_trips(stm_trips_fp, routes_map)
-    stm_stop_times = load_stm_stop_times(stm_stop_times_fp)
-    
-    print(f"✅ Loaded {len(stm_trips)} trips")
-    print(f"✅ Loaded {len(routes_map)} routes")
+# ─── load GTFS static data ───────────────────────────────────
+# Loaded once here, then reloaded in the background whenever the files
+# change (admin upload) without restarting the app
+start_gtfs_watcher(STM_DIR, GTFS_WATCH_SECONDS, on_reload=lambda: request_refresh())
 
 def get_weather():
     """Fetch weather from WeatherAPI at most once per CACHE_TTL."""
@@ -145,7 +138,8 @@ def get_weather():
     # if cache is stale, refresh it
     if now - _weather_cache["ts"] > CACHE_TTL:
         try:
-            resp = requests.get(
+            resp = http_get(
+                "weather",
                 f"http://api.weatherapi.com/v1/current.json"
                 f"?key={WEATHER_API_KEY}"
                 "&q=Montreal,QC"
@@ -168,104 +162,52 @@ def get_weather():
 # ====================================================================
 # Metro Alerts Processing Functions
 # ====================================================================
+METRO_LINE_IDS = ("1", "2", "4", "5")
+
+# Line name -> alert text of the disruption last logged at warning level
+_metro_disruptions = {}
+
+def log_metro_transitions(lines):
+    """Log once at warning level when a line becomes disrupted or recovers."""
+    for line in lines:
+        previous = _metro_disruptions.get(line.name)
+        current = None if line.is_normal else line.alert_description
+        if current == previous:
+            continue
+        if current is None:
+            logger.warning(f"[METRO] {line.name} ({line.color}): service rétabli")
+            _metro_disruptions.pop(line.name, None)
+        else:
+            logger.warning(f"[METRO] {line.name} ({line.color}) perturbée: {current}")
+            _metro_disruptions[line.name] = current
+
 def process_metro_alerts():
     if os.environ.get('ENVIRONMENT') == 'development':
         from backend.mock_stm_data import get_mock_metro_lines
         return get_mock_metro_lines()
     try:
-        # Fetch all STM alerts
-        alerts_data = fetch_stm_alerts()
+        # Normalized alert table, shared with process_stm_alerts()
+        alerts_data = get_alert_table()
         
         # Default status for all lines
-        metro_status = {
-            "1": {
-                "name": "Ligne 1",
-                "color": "Verte",
-                "status": "Service normal",
-                "statusColor": "text-green-400",
-                "icon": "green-line",
-                "is_normal": True,
-                "alert_description": None
-            },
-            "2": {
-                "name": "Ligne 2",
-                "color": "Orange",
-                "status": "Service normal",
-                "statusColor": "text-green-400",
-                "icon": "orange-line",
-                "is_normal": True,
-                "alert_description": None
-            },
-            "4": {
-                "name": "Ligne 4",
-                "color": "Jaune",
-                "status": "Service normal",
-                "statusColor": "text-green-400",
-                "icon": "yellow-line",
-                "is_normal": True,
-                "alert_description": None
-            },
-            "5": {
-                "name": "Ligne 5",
-                "color": "Bleue",
-                "status": "Service normal",
-                "statusColor": "text-green-400",
-                "icon": "blue-line",
-                "is_normal": True,
-                "alert_description": None
-            }
-        }
+        metro_status = dict(zip(METRO_LINE_IDS, get_default_metro_status()))
         
         # Process alerts to check for metro disruptions
         if alerts_data:
             for alert in alerts_data:
                 try:
-                    informed_entities = alert.get("informed_entities", [])
-                    
-                    # Get French header and description for this alert
-                    header_texts = alert.get("header_texts", [])
-                    description_texts = alert.get("description_texts", [])
-                    
-                    # Debug: Log what we're getting from the API
-                    logger.debug(f"Alert header_texts: {header_texts}")
-                    logger.debug(f"Alert description_texts: {description_texts}")
-                    
-                    header = ""
-                    description = ""
-                    for ht in header_texts:
-                        if ht.get("language") == "fr":
-                            header = ht.get("text", "")
-                            break
-                    
-                    for dt in description_texts:
-                        if dt.get("language") == "fr":
-                            description = dt.get("text", "")
-                            break
-                    
-                    # Remove HTML tags from description
-                    if description:
-                        description = re.sub(r'<[^>]+>', '', description).strip()
-                    
-                    # Debug: Log what we extracted
-                    logger.debug(f"Extracted header: '{header}'")
-                    logger.debug(f"Extracted description (cleaned): '{description}'")
+                    header = alert.header
+                    description = alert.description
                     
                     # Check if this is a network-wide alert (affects all metro)
-                    is_network_wide = False
-                    affected_metro_lines = []
+                    is_network_wide = alert.is_network_wide
+                    if is_network_wide:
+                        logger.info(f"[ALERT] Detected network-wide STM alert: {header[:50]}...")
                     
-                    for entity in informed_entities:
-                        # Check for agency-wide alert (like strikes)
-                        if entity.get("agency_id") == "STM":
-                            is_network_wide = True
-                            logger.info(f"[ALERT] Detected network-wide STM alert: {header[:50]}...")
-                        
-                        # Check for specific metro line alerts using route_short_name
-                        route_short_name = entity.get("route_short_name", "")
-                        route_id = entity.get("route_id", "")
-                        
+                    affected_metro_lines = []
+                    for route_short_name, route_id, _ in alert.entities:
                         # Metro routes can be in either field
-                        metro_line = route_short_name if route_short_name in ["1", "2", "4", "5"] else (route_id if route_id in ["1", "2", "4", "5"] else None)
+                        metro_line = route_short_name if route_short_name in METRO_LINE_IDS else (route_id if route_id in METRO_LINE_IDS else None)
                         
                         if metro_line:
                             affected_metro_lines.append(metro_line)
@@ -291,22 +233,23 @@ def process_metro_alerts():
                     # Apply the alert to affected lines
                     if is_network_wide:
                         # Network-wide alert affects all metro lines
-                        logger.warning(f"[WARNING] APPLYING NETWORK-WIDE ALERT TO ALL METRO LINES")
+                        logger.info("[METRO] Applying network-wide alert to all metro lines")
                         logger.info(f"   Alert text: '{alert_text}'")
-                        for line_id in metro_status.keys():
-                            metro_status[line_id]["is_normal"] = False
-                            metro_status[line_id]["status"] = "Service perturbé"
-                            metro_status[line_id]["alert_description"] = alert_text
-                            metro_status[line_id]["statusColor"] = "text-red-400"
+                        for line in metro_status.values():
+                            line.is_normal = False
+                            line.status = "Service perturbé"
+                            line.alert_description = alert_text
+                            line.statusColor = "text-red-400"
                     elif affected_metro_lines:
                         # Apply alert to specific metro lines
-                        logger.warning(f"[WARNING] APPLYING ALERT TO LINES: {', '.join(affected_metro_lines)}")
+                        logger.info(f"[METRO] Applying alert to lines: {', '.join(affected_metro_lines)}")
                         logger.info(f"   Alert text: '{alert_text}'")
                         for line_id in affected_metro_lines:
-                            metro_status[line_id]["is_normal"] = False
-                            metro_status[line_id]["status"] = "Service perturbé"
-                            metro_status[line_id]["alert_description"] = alert_text
-                            metro_status[line_id]["statusColor"] = "text-red-400"
+                            line = metro_status[line_id]
+                            line.is_normal = False
+                            line.status = "Service perturbé"
+                            line.alert_description = alert_text
+                            line.statusColor = "text-red-400"
                         
                 except Exception as e:
                     logger.error(f"Error processing individual metro alert: {e}")
@@ -318,8 +261,9 @@ def process_metro_alerts():
         result = list(metro_status.values())
         logger.info(f"[STATUS] Final Metro Status:")
         for line in result:
-            status_text = "NORMAL" if line["is_normal"] else "DISRUPTED"
-            logger.info(f"  [{status_text}] {line['name']} ({line['color']}): {line['status']}")
+            status_text = "NORMAL" if line.is_normal else "DISRUPTED"
+            logger.info(f"  [{status_text}] {line.name} ({line.color}): {line.status}")
+        log_metro_transitions(result)
         
         return result
         
@@ -332,58 +276,23 @@ def process_metro_alerts():
 def get_default_metro_status():
     """Return default metro status when API fails"""
     return [
-        {
-            "name": "Ligne 1",
-            "color": "Verte",
-            "status": "Service normal",
-            "statusColor": "text-green-400",
-            "icon": "green-line",
-            "is_normal": True,
-            "alert_description": None
-        },
-        {
-            "name": "Ligne 2",
-            "color": "Orange",
-            "status": "Service normal",
-            "statusColor": "text-green-400",
-            "icon": "orange-line",
-            "is_normal": True,
-            "alert_description": None
-        },
-        {
-            "name": "Ligne 4",
-            "color": "Jaune",
-            "status": "Service normal",
-            "statusColor": "text-green-400",
-            "icon": "yellow-line",
-            "is_normal": True,
-            "alert_description": None
-        },
-        {
-            "name": "Ligne 5",
-            "color": "Bleue",
-            "status": "Service normal",
-            "statusColor": "text-green-400",
-            "icon": "blue-line",
-            "is_normal": True,
-            "alert_description": None
-        }
+        MetroLine(name="Ligne 1", color="Verte", icon="green-line"),
+        MetroLine(name="Ligne 2", color="Orange", icon="orange-line"),
+        MetroLine(name="Ligne 4", color="Jaune", icon="yellow-line"),
+        MetroLine(name="Ligne 5", color="Bleue", icon="blue-line"),
     ]
 
 def merge_alerts_into_buses(buses, processed_alerts):
     """
     Merge alert information into bus objects.
     """
+    alerts_by_route = get_alert_index(processed_alerts)["by_route"]
     for bus in buses:
-        route_id = bus.get("route_id")
-        
-        # Find matching alert
-        for alert in processed_alerts:
-            if route_id in alert.get("routes", []):
-                if alert.get("effect") == "NO_SERVICE":
-                    bus["cancelled"] = True
-                    bus["delayed_text"] = None
-                break
+        # First alert naming this route
+        route_alerts = alerts_by_route.get(bus.route_id)
+        if route_alerts and route_alerts[0].effect == "NO_SERVICE":
+            bus.cancelled = True
+            bus.delayed_text = None
     
     return buses
 
@@ -394,151 +303,298 @@ def index():
         "status": "ok",
         "message": "ETSignage API is running",
         "endpoints": {
-            "data": "/api/data"
+            "data": "/api/data",
+            "weather": "/api/weather",
+            "alerts": "/api/alerts",
+            "departures": "/api/departures",
+            "metro": "/api/metro",
+            "stream": "/api/stream",
+            "metrics": "/api/metrics"
         }
     })
 
-@app.route('/api/data', methods=['GET'])
-def get_data():
+def build_transit_snapshot(now=None):
     """
-    Main API endpoint that returns all transit data
+    Run the full transit pipeline and return the /api/data payload.
+    Called by the background poller (and once on cold start).
+    `now` fixes the instant the board is computed against (default: the
+    current time, read once per snapshot).
     """
+    if now is None:
+        now = datetime.now()
+    # One dataset for the whole snapshot, even if a reload swaps it meanwhile
+    gtfs = get_gtfs_dataset()
+
+    # ========== FETCH UPSTREAM FEEDS ==========
+    # The three STM feeds and the weather are fetched in parallel over pooled
+    # connections; the alert processors below then read the warm alerts cache.
+    feeds = fetch_concurrently({
+        "alerts":    fetch_stm_alerts,
+        "trips":     fetch_stm_realtime_data,
+        "vehicles":  fetch_stm_vehicle_positions,
+        "weather":   get_weather,
+    })
+
+    # Process metro alerts first
+    metro_lines = process_metro_alerts()
+    
+    # ========== STM ALERTS ==========
+    filtered_alerts = []
     try:
-        # Process metro alerts first
-        metro_lines = process_metro_alerts()
+        processed_stm = process_stm_alerts()
+        logger.debug(f"Processed STM alerts: {processed_stm}")
         
-        # ========== STM ALERTS ==========
-        filtered_alerts = []
-        try:
-            processed_stm = process_stm_alerts()
-            logger.debug(f"Processed STM alerts: {processed_stm}")
-            
-            # Format alerts for frontend
-            for alert in processed_stm:
-                alert_obj = {
-                    "header": alert.get("header", "Alerte"),
-                    "description": alert.get("description", ""),
-                    "alert_type": alert.get("alert_type", "info"),
-                    "severity": alert.get("severity", "info")
-                }
-                
-                # Add route information if it exists
-                if alert.get("is_network_wide"):
-                    alert_obj["routes"] = "Réseau STM"
-                    alert_obj["stop"] = "Général"
-                elif alert.get("routes"):
-                    routes_str = ", ".join(alert["routes"])
-                    alert_obj["routes"] = routes_str
-                    alert_obj["stop"] = "Ligne spécifique"
-                else:
-                    alert_obj["routes"] = "N/A"
-                    alert_obj["stop"] = "N/A"
-                
-                filtered_alerts.append(alert_obj)
-            
-            # ===== ADD METRO ALERTS TO THE BANNER =====
-            logger.info("[METRO] Checking metro lines for alerts to add to banner...")
-            for metro_line in metro_lines:
-                if not metro_line.get("is_normal") and metro_line.get("alert_description"):
-                    metro_alert = {
-                        "header": f"Métro {metro_line['name']} - {metro_line['color']}",
-                        "description": metro_line["alert_description"],
-                        "routes": f"Métro {metro_line['color']}",
-                        "stop": "Métro",
-                        "alert_type": "metro",
-                        "severity": "warning"
-                    }
-                    filtered_alerts.append(metro_alert)
-                    logger.info(f"  [OK] Added metro alert to banner: {metro_alert['header']}")
-                
-        except Exception as e:
-            logger.error(f"ERROR processing STM alerts: {e}")
-            import traceback
-            traceback.print_exc()
-
-        # ========== STM BUSES WITH OCCUPANCY ==========
-        buses = []
-        try:
-            if os.environ.get('ENVIRONMENT') == 'development':
-                from backend.mock_stm_data import get_mock_processed_buses
-                buses = get_mock_processed_buses()
+        # Format alerts for frontend
+        for alert in processed_stm:
+            # Add route information if it exists
+            if alert.is_network_wide:
+                routes_str, stop_str = "Réseau STM", "Général"
+            elif alert.routes:
+                routes_str, stop_str = ", ".join(alert.routes), "Ligne spécifique"
             else:
-                from .config import BUS_ROUTES
+                routes_str, stop_str = "N/A", "N/A"
+
+            filtered_alerts.append(BannerAlert(
+                header=alert.header,
+                description=alert.description,
+                alert_type=alert.alert_type,
+                severity=alert.severity,
+                routes=routes_str,
+                stop=stop_str
+            ))
+        
+        # ===== ADD METRO ALERTS TO THE BANNER =====
+        logger.info("[METRO] Checking metro lines for alerts to add to banner...")
+        for metro_line in metro_lines:
+            if not metro_line.is_normal and metro_line.alert_description:
+                metro_alert = BannerAlert(
+                    header=f"Métro {metro_line.name} - {metro_line.color}",
+                    description=metro_line.alert_description,
+                    alert_type="metro",
+                    severity="warning",
+                    routes=f"Métro {metro_line.color}",
+                    stop="Métro"
+                )
+                filtered_alerts.append(metro_alert)
+                logger.info(f"  [OK] Added metro alert to banner: {metro_alert.header}")
             
-            stm_trip_entities = fetch_stm_realtime_data()
+    except Exception as e:
+        logger.error(f"ERROR processing STM alerts: {e}")
+        import traceback
+        traceback.print_exc()
+
+    # ========== STM BUSES WITH OCCUPANCY ==========
+    buses = []
+    try:
+        if os.environ.get('ENVIRONMENT') == 'development':
+            from backend.mock_stm_data import get_mock_processed_buses
+            buses = get_mock_processed_buses()
+        else:
+            stm_trip_entities = feeds["trips"] or []
+            # Occupancy is only needed for the trips serving our stops
             # FIX: Pass routes_map so vehicle positions can convert GTFS IDs to short names
-            positions_dict = fetch_stm_positions_dict(BUS_ROUTES, stm_trips, routes_map)
-            
+            positions_dict = fetch_stm_positions_dict(
+                BUS_ROUTES, gtfs["stm_trips"], gtfs["routes_map"],
+                trip_ids=get_matched_trip_ids(stm_trip_entities),
+                entities=feeds["vehicles"] or [],
+                dataset_version=gtfs["version"]
+            )
+        
             # Debug: Log how many vehicle positions we got
-            logger.info(f"[OCCUPANCY] Fetched {len(positions_dict)} vehicle positions")
-            if len(positions_dict) > 0:
+            logger.debug(f"[OCCUPANCY] Fetched {len(positions_dict)} vehicle positions")
+            if logger.isEnabledFor(logging.DEBUG):
                 # Show first few for debugging
                 for i, ((route, trip), pos_data) in enumerate(list(positions_dict.items())[:3]):
-                    logger.info(f"  Position {i+1}: Route={route}, Trip={trip}, Occ={pos_data.get('occupancy')}")
-            else:
-                logger.warning("[OCCUPANCY] No vehicle positions found - occupancy will show as 'Unknown'")
-            
+                    logger.debug(f"  Position {i+1}: Route={route}, Trip={trip}, Occ={pos_data.get('occupancy')}")
+        
             buses = process_stm_trip_updates(
                 stm_trip_entities,
-                stm_trips,
-                stm_stop_times,
-                positions_dict
+                gtfs["stm_trips"],
+                gtfs["stm_stop_times"],
+                positions_dict,
+                stop_time_index=gtfs["stop_time_index"],
+                service_calendar=gtfs["calendar"],
+                scheduled_seconds=gtfs["scheduled_seconds"],
+                now=now
             )
 
-            # Enhanced debug logging for occupancy
-            logger.info("----- DEBUG: Final Merged STM Buses with Occupancy -----")
-            status_map = {0: "INCOMING_AT", 1: "STOPPED_AT", 2: "IN_TRANSIT_TO"}
-            
-            for b in buses:
-                raw_stat = b.get("current_status")
-                if isinstance(raw_stat, int):
-                    stat_str = status_map.get(raw_stat, f"Unknown({raw_stat})")
-                else:
-                    stat_str = str(raw_stat)
-                
-                # Log occupancy information
-                occupancy = b.get("occupancy", "Unknown")
-                logger.info(
-                    f"Route={b['route_id']}, Trip={b['trip_id']}, "
-                    f"Stop={b['stop_id']}, ArrTime={b['arrival_time']}, "
-                    f"Occupancy={occupancy}, AtStop={b['at_stop']}, "
-                    f"Lat={b.get('lat')}, Lon={b.get('lon')}, Dist={b.get('distance_m')}m, "
-                    f"currentStatus={stat_str}"
-                )
-            logger.info("-----------------------------------------")
+            # Enhanced debug logging for occupancy (formatted only when DEBUG is on)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("----- DEBUG: Final Merged STM Buses with Occupancy -----")
+                status_map = {0: "INCOMING_AT", 1: "STOPPED_AT", 2: "IN_TRANSIT_TO"}
+
+                for b in buses:
+                    raw_stat = b.current_status
+                    if isinstance(raw_stat, int):
+                        stat_str = status_map.get(raw_stat, f"Unknown({raw_stat})")
+                    else:
+                        stat_str = str(raw_stat)
+
+                    # Log occupancy information
+                    logger.debug(
+                        f"Route={b.route_id}, Trip={b.trip_id}, "
+                        f"Stop={b.stop_id}, ArrTime={b.arrival_time}, "
+                        f"Occupancy={b.occupancy}, AtStop={b.at_stop}, "
+                        f"Lat={b.lat}, Lon={b.lon}, "
+                        f"currentStatus={stat_str}"
+                    )
+                logger.debug("-----------------------------------------")
 
             buses = merge_alerts_into_buses(buses, processed_stm if 'processed_stm' in locals() else [])
-        except Exception as e:
-            logger.error(f"ERROR processing buses: {e}")
-            import traceback
-            traceback.print_exc()
-
-        # ========== WEATHER ==========
-        weather = get_weather()
-
-        # Build response
-        response = {
-            "buses": buses,
-            "metro_lines": metro_lines,
-            "weather": weather,
-            "alerts": filtered_alerts,
-            "debug": {
-                "total_buses": len(buses),
-                "total_metro_lines": len(metro_lines),
-                "alerts_count": len(filtered_alerts)
-            }
+    except Exception as e:
+        logger.error(f"ERROR processing buses: {e}")
+        import traceback
+        traceback.print_exc()
+
+    # ========== WEATHER ==========
+    weather = feeds["weather"] or get_weather()
+
+    # Build response
+    response = {
+        "buses": buses,
+        "metro_lines": metro_lines,
+        "weather": weather,
+        "alerts": filtered_alerts,
+        "debug": {
+            "total_buses": len(buses),
+            "total_metro_lines": len(metro_lines),
+            "alerts_count": len(filtered_alerts)
         }
+    }
+
+    return response
+
+start_realtime_poller(build_transit_snapshot, REALTIME_POLL_SECONDS)
+
+def snapshot_response(body, etag):
+    """
+    Serve a pre-encoded JSON body with a strong ETag.
+    Kiosks revalidate on every poll and get 304 Not Modified until it changes.
+    """
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/api/data', methods=['GET'])
+def get_data():
+    """
+    Main API endpoint that returns all transit data
+    Serves the latest background snapshot instead of hitting the STM API.
+    """
+    try:
+        snapshot = get_or_build_snapshot(build_transit_snapshot)
+        return snapshot_response(snapshot["body"], snapshot["etag"])
 
-        return jsonify(response), 200
-        
     except Exception as e:
         logger.error(f"Error in get_data: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+def snapshot_section_response(key):
+    """Serve one top-level section of the snapshot, e.g. {"weather": {...}}."""
+    try:
+        snapshot = get_or_build_snapshot(build_transit_snapshot)
+        body, etag = snapshot["sections"][key]
+        return snapshot_response(body, etag)
+    except Exception as e:
+        logger.error(f"Error serving {key}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/weather', methods=['GET'])
+def get_weather_data():
+    return snapshot_section_response("weather")
+
+@app.route('/api/alerts', methods=['GET'])
+def get_alerts_data():
+    return snapshot_section_response("alerts")
+
+@app.route('/api/departures', methods=['GET'])
+def get_departures_data():
+    return snapshot_section_response("buses")
+
+@app.route('/api/metro', methods=['GET'])
+def get_metro_data():
+    return snapshot_section_response("metro_lines")
+
+_stream_clients = {"count": 0}
+_stream_clients_lock = threading.Lock()
+
+def snapshot_diff_events():
+    """
+    SSE generator: sends every section on connect, then only the sections
+    whose ETag changed each time a new snapshot is published.
+    """
+    sent_etags = {}
+    snapshot = get_or_build_snapshot(build_transit_snapshot)
+    yield f"retry: {SSE_KEEPALIVE_SECONDS * 1000}\n\n"
+    while True:
+        changed = [
+            body for key, (body, etag) in snapshot["sections"].items()
+            if sent_etags.get(key) != etag
+        ]
+        if changed:
+            sent_etags = {key: etag for key, (_, etag) in snapshot["sections"].items()}
+            # Merge the pre-encoded {"key": value} bodies without re-serializing
+            diff = b"{" + b",".join(body[1:-1] for body in changed) + b"}"
+            yield f"id: {snapshot['version']}\nevent: update\ndata: ".encode("utf-8") + diff + b"\n\n"
+
+        version = snapshot["version"]
+        snapshot = wait_for_change(version, SSE_KEEPALIVE_SECONDS)
+        if snapshot["version"] == version:
+            # Comment line keeps proxies from closing an idle connection
+            yield ": keepalive\n\n"
+
+@app.route('/api/stream', methods=['GET'])
+def stream_data():
+    """
+    Server-Sent Events channel that pushes snapshot diffs as they happen.
+    Clients beyond SSE_MAX_CLIENTS get 503 and should keep polling.
+    """
+    if _stream_clients["count"] >= SSE_MAX_CLIENTS:
+        return jsonify({"error": "too many stream clients"}), 503
+
+    def events():
+        # Counted inside the generator so the finally always runs once started
+        with _stream_clients_lock:
+            _stream_clients["count"] += 1
+        try:
+            yield from snapshot_diff_events()
+        finally:
+            with _stream_clients_lock:
+                _stream_clients["count"] -= 1
+
+    return app.response_class(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route('/api/reload_gtfs', methods=['POST'])
+def reload_gtfs():
+    """Reload the GTFS static files in the background (local admin only)."""
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return jsonify({"error": "forbidden"}), 403
+    request_gtfs_reload()
+    return jsonify({"status": "reloading", "version": get_gtfs_dataset_version()}), 202
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Upstream latency metrics per endpoint and snapshot freshness."""
+    snapshot = get_snapshot()
+    return jsonify({
+        "http": get_http_metrics(),
+        "gtfs_version": get_gtfs_dataset_version(),
+        "snapshot": {
+            "version": snapshot["version"],
+            "age_s": round(time.time() - snapshot["ts"], 1) if snapshot["ts"] else None,
+        },
+    }), 200
+
 if __name__ == '__main__':
     from waitress import serve
     port = int(os.environ.get('PORT', 5000))
     print(f"Starting ETSignage (Flux) on http://0.0.0.0:{port}")
-    serve(app, host='0.0.0.0', port=port)
\ No newline at end of file
+    # Extra threads so open /api/stream connections don't starve regular requests
+    serve(app, host='0.0.0.0', port=port, threads=8)
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""
+GTFS Static Dataset
+Holds the loaded GTFS static data (trips, stop times, indexes, calendar) as
+one versioned dataset. A new dataset is built in the background when the
+files change, or on request, and swapped in atomically, so the display
+keeps being served from the previous data until the new one is ready.
+"""
+import os
+import time
+import threading
+import logging
+
+from backend.loaders.stm import (
+    load_stm_routes,
+    load_stm_gtfs_trips,
+    load_stm_stop_times,
+    get_gtfs_load_filter,
+    build_stm_stop_time_index,
+    build_stm_scheduled_seconds,
+    pack_stop_times,
+)
+from backend.loaders.gtfs_cache import load_or_compile_gtfs_cache
+from backend.loaders.service_calendar import load_service_calendar
+
+logger = logging.getLogger('BdeB-GTFS')
+
+REQUIRED_FILES = ["routes.txt", "trips.txt", "stop_times.txt"]
+WATCHED_FILES = REQUIRED_FILES + ["calendar.txt", "calendar_dates.txt"]
+
+# Current dataset. The whole dict is swapped on publish.
+_dataset = {
+    "version":   0,
+    "signature": None,  # (name, size, mtime) of the files it was built from
+    "data":      None,
+}
+
+_reload_lock = threading.Lock()
+_reload_event = threading.Event()
+_watcher_thread = None
+
+
+def get_gtfs_dataset():
+    """Return the current dataset dict (version, routes_map, stm_trips, stm_stop_times, ...)."""
+    return _dataset["data"] or empty_gtfs_dataset()
+
+
+def get_gtfs_dataset_version():
+    return _dataset["version"]
+
+
+def gtfs_files_signature(gtfs_dir):
+    """(name, size, mtime_ns) of each watched file; changes whenever a file is replaced."""
+    signature = []
+    for name in WATCHED_FILES:
+        try:
+            st = os.stat(os.path.join(gtfs_dir, name))
+        except OSError:
+            continue
+        signature.append((name, st.st_size, st.st_mtime_ns))
+    return tuple(signature)
+
+
+def empty_gtfs_dataset():
+    return {
+        "version":           0,
+        "routes_map":        {},
+        "stm_trips":         {},
+        "stm_stop_times":    pack_stop_times(()),
+        "stop_time_index":   {},
+        "scheduled_seconds": {},
+        "calendar":          None,
+    }
+
+
+def load_gtfs_dataset(gtfs_dir, allow_missing=True):
+    """
+    Load the GTFS files of gtfs_dir into a new dataset dict.
+    Missing required files give an empty dataset, or raise FileNotFoundError
+    when allow_missing is False (a reload must not replace good data).
+    """
+    missing = []
+    for fname in REQUIRED_FILES:
+        fpath = os.path.join(gtfs_dir, fname)
+        if not os.path.isfile(fpath):
+            missing.append(f"stm/{fname}")
+        else:
+            # Print file size to confirm it exists
+            fsize = os.path.getsize(fpath) / 1024
+            print(f"✓ Found {fname} ({fsize:.1f} KB)")
+
+    if missing and not allow_missing:
+        raise FileNotFoundError(f"Fichiers GTFS manquants: {', '.join(missing)}")
+    if missing:
+        print("⚠️  Fichiers GTFS manquants:")
+        for m in missing:
+            print(f"   • {m}")
+        print("\nL'application démarre quand même. Téléchargez les fichiers GTFS via l'interface admin.")
+        return empty_gtfs_dataset()
+
+    print("📂 Loading GTFS files...")
+
+    # Only materialize trips/stop_times for the configured routes and stops
+    load_routes, load_stops = get_gtfs_load_filter()
+
+    try:
+        # Memory-mapped compiled cache, rebuilt only when the GTFS files change
+        routes_map, stm_trips, stm_stop_times = load_or_compile_gtfs_cache(
+            gtfs_dir, load_routes, load_stops
+        )
+    except Exception as e:
+        print(f"⚠️  Compiled GTFS cache unavailable, parsing CSV files: {e}")
+        routes_map = load_stm_routes(os.path.join(gtfs_dir, "routes.txt"))
+        stm_trips = load_stm_gtfs_trips(os.path.join(gtfs_dir, "trips.txt"), routes_map, route_ids=load_routes)
+        stm_stop_times = load_stm_stop_times(
+            os.path.join(gtfs_dir, "stop_times.txt"),
+            stop_ids=load_stops,
+            trip_ids=set(stm_trips) if load_routes is not None else None
+        )
+
+    dataset = {
+        "version":           0,  # set by reload_gtfs_dataset() on publish
+        "routes_map":        routes_map,
+        "stm_trips":         stm_trips,
+        "stm_stop_times":    stm_stop_times,
+        "stop_time_index":   build_stm_stop_time_index(stm_trips, stm_stop_times),
+        # Scheduled arrivals at our stops as seconds, for the delay check
+        "scheduled_seconds": build_stm_scheduled_seconds(stm_trips, stm_stop_times),
+        # Active service_ids per day from calendar.txt / calendar_dates.txt
+        "calendar":          load_service_calendar(gtfs_dir),
+    }
+
+    print(f"✅ Loaded {len(stm_trips)} trips ({len(stm_stop_times)} stop times)")
+    print(f"✅ Loaded {len(routes_map)} routes")
+    return dataset
+
+
+def reload_gtfs_dataset(gtfs_dir):
+    """
+    Build a dataset from gtfs_dir and swap it in. The previous dataset keeps
+    serving until the swap; on failure (including missing files once a
+    dataset is loaded) it stays in place.
+    Returns True if a new dataset was published.
+    """
+    global _dataset
+    with _reload_lock:
+        signature = gtfs_files_signature(gtfs_dir)
+        started = time.monotonic()
+        try:
+            data = load_gtfs_dataset(gtfs_dir, allow_missing=_dataset["data"] is None)
+        except FileNotFoundError as e:
+            logger.error(f"[GTFS] Reload skipped, keeping dataset v{_dataset['version']}: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"[GTFS] Reload failed, keeping dataset v{_dataset['version']}: {e}", exc_info=True)
+            return False
+        version = _dataset["version"] + 1
+        # Carried in the data too, so a snapshot keys caches on the dataset it read
+        data["version"] = version
+        _dataset = {
+            "version":   version,
+            "signature": signature,
+            "data":      data,
+        }
+    print(f"✅ GTFS dataset v{_dataset['version']} ready ({time.monotonic() - started:.1f}s)")
+    return True
+
+
+def request_gtfs_reload():
+    """Ask the watcher to reload now (e.g. after an admin upload)."""
+    _reload_event.set()
+
+
+def _watch_loop(gtfs_dir, interval, on_reload):
+    pending = None
+    failed = None  # signature of the last failed reload, not retried until it changes
+    while True:
+        forced = _reload_event.wait(interval)
+        _reload_event.clear()
+
+        signature = gtfs_files_signature(gtfs_dir)
+        if not forced:
+            if signature == _dataset["signature"] or signature == failed:
+                pending = None
+                continue
+            # Files are replaced one at a time: wait until they stop changing
+            if signature != pending:
+                pending = signature
+                continue
+        pending = None
+
+        if not reload_gtfs_dataset(gtfs_dir):
+            failed = signature
+            continue
+        failed = None
+        if on_reload is not None:
+            on_reload()
+
+
+def start_gtfs_watcher(gtfs_dir, interval, on_reload=None):
+    """
+    Load the dataset synchronously if needed, then start the background
+    thread that reloads it when the GTFS files change or a reload is
+    requested. interval <= 0 disables the file watch (requests still work).
+    """
+    global _watcher_thread
+    if _dataset["data"] is None:
+        reload_gtfs_dataset(gtfs_dir)
+    if _watcher_thread is not None and _watcher_thread.is_alive():
+        return _watcher_thread
+    _watcher_thread = threading.Thread(
+        target=_watch_loop,
+        args=(gtfs_dir, interval if interval > 0 else None, on_reload),
+        name="gtfs-watcher",
+        daemon=True,
+    )
+    _watcher_thread.start()
+    return _watcher_thread
@@ -0,0 +1,82 @@
+"""
+Logging Setup
+Leveled logging for the 'BdeB-GTFS' logger. Records are handed to a bounded
+queue and written by a listener thread, so the poller and request threads
+never block on console I/O. Per-vehicle / per-alert lines are DEBUG and only
+reach the console with LOG_LEVEL=DEBUG.
+"""
+import sys
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from backend.config import LOG_LEVEL, LOG_QUEUE_SIZE
+
+LOGGER_NAME = 'BdeB-GTFS'
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Rate-limit chatty call sites: a record logged with
+    extra={"sample_every": N} passes once every N calls from the same line.
+    Other records always pass.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._counts = {}
+
+    def filter(self, record):
+        every = getattr(record, "sample_every", None)
+        if not every or every <= 1:
+            return True
+        site = (record.pathname, record.lineno)
+        count = self._counts.get(site, 0)
+        self._counts[site] = count + 1
+        return count % every == 0
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=None):
+    """
+    Configure the 'BdeB-GTFS' logger once per process and return it.
+    `level` overrides LOG_LEVEL (e.g. "DEBUG").
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    with _setup_lock:
+        logger.setLevel((level or LOG_LEVEL).upper())
+        if _listener is not None:
+            return logger
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter())
+        logger.addHandler(handler)
+        logger.propagate = False
+
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(logging.Formatter(LOG_FORMAT, "%H:%M:%S"))
+        _listener = QueueListener(log_queue, console)
+        _listener.start()
+        atexit.register(_listener.stop)
+    return logger
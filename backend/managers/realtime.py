@@ -0,0 +1,137 @@
+"""
+Realtime Refresh Engine
+Polls the STM feeds in the background and keeps a ready-to-serve snapshot,
+so /api/data never waits on an upstream round trip.
+"""
+import threading
+import time
+import hashlib
+import logging
+
+import msgspec
+
+logger = logging.getLogger('BdeB-GTFS')
+
+# Latest published snapshot. The whole dict is swapped on publish so readers
+# never see a half-built payload.
+_state = {
+    "version": 0,     # incremented whenever the payload changes
+    "ts":      0,     # timestamp of the last successful refresh
+    "data":    None,
+    "body":    None,  # data pre-encoded as UTF-8 JSON
+    "etag":    None,  # strong ETag (hash of body)
+    "sections": {},   # top-level key -> (body, etag) of {key: data[key]}
+}
+
+_build_lock = threading.Lock()
+# Notified whenever the snapshot version moves (used by the SSE stream)
+_published = threading.Condition()
+_wake_event = threading.Event()
+_poller_thread = None
+
+
+def get_snapshot():
+    """Return the latest snapshot dict (version, ts, data, body, etag, sections)."""
+    return _state
+
+
+def encode_json(data):
+    """
+    Serialize once for every poll: returns (body bytes, strong ETag).
+    Dicts and the records.* Structs are encoded straight to UTF-8 in one pass.
+    """
+    body = msgspec.json.encode(data)
+    return body, hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def publish_snapshot(data):
+    """
+    Atomically replace the current snapshot with freshly built data.
+    The version only moves when the encoded payload actually changed.
+    """
+    global _state
+    body, etag = encode_json(data)
+    changed = etag != _state["etag"]
+    _state = {
+        "version": _state["version"] + 1 if changed else _state["version"],
+        "ts":      time.time(),
+        "data":    data,
+        "body":    body,
+        "etag":    etag,
+        # Each section is encoded on its own so lightweight endpoints
+        # (weather, alerts, ...) serve and revalidate independently
+        "sections": {key: encode_json({key: value}) for key, value in data.items()},
+    }
+    if changed:
+        with _published:
+            _published.notify_all()
+    return _state
+
+
+def wait_for_change(version, timeout):
+    """
+    Block until the snapshot version differs from `version` or the timeout
+    elapses, then return the latest snapshot.
+    """
+    with _published:
+        _published.wait_for(lambda: _state["version"] != version, timeout)
+    return _state
+
+
+def refresh_snapshot(build_snapshot):
+    """Build and publish a snapshot. Only one build runs at a time."""
+    with _build_lock:
+        return publish_snapshot(build_snapshot())
+
+
+def get_or_build_snapshot(build_snapshot):
+    """
+    Return the latest snapshot, building one synchronously on cold start
+    (first request before the poller has completed its first cycle).
+    """
+    if _state["data"] is not None:
+        return _state
+    with _build_lock:
+        # Another request may have built it while we waited on the lock
+        if _state["data"] is not None:
+            return _state
+        return publish_snapshot(build_snapshot())
+
+
+def request_refresh():
+    """Wake the poller so it refreshes now instead of at the next interval."""
+    _wake_event.set()
+
+
+def _poll_loop(build_snapshot, interval):
+    logger.info(f"[REALTIME] Poller started (interval: {interval}s)")
+    while True:
+        started = time.monotonic()
+        try:
+            snapshot = refresh_snapshot(build_snapshot)
+            logger.debug(
+                f"[REALTIME] Snapshot v{snapshot['version']} built in "
+                f"{time.monotonic() - started:.2f}s"
+            )
+        except Exception as e:
+            # Keep serving the last good snapshot
+            logger.error(f"[REALTIME] Snapshot refresh failed: {e}")
+
+        elapsed = time.monotonic() - started
+        _wake_event.wait(max(0, interval - elapsed))
+        _wake_event.clear()
+
+
+def start_realtime_poller(build_snapshot, interval):
+    """Start the background poller once per process."""
+    global _poller_thread
+    if _poller_thread is not None and _poller_thread.is_alive():
+        return _poller_thread
+    _poller_thread = threading.Thread(
+        target=_poll_loop,
+        args=(build_snapshot, interval),
+        name="realtime-poller",
+        daemon=True,
+    )
+    _poller_thread.start()
+    return _poller_thread
@@ -2,6 +2,7 @@
 Mock STM data for development/testing
 Prevents hitting real API rate limits
 """
+from backend.records import MetroLine
 
 def get_mock_trip_entities():
     """Mock GTFS realtime trip updates"""
@@ -79,24 +80,18 @@ def get_mock_processed_buses():
 def get_mock_metro_lines():
     """Mock metro line status"""
     return [
-        {
-            "id": 1,
-            "name": "Ligne 1",
-            "color": "Verte",
-            "status": "Service normal du métro",
-            "statusColor": "text-green-400",
-            "icon": "green-line",
-            "is_normal": True,
-            "alert_description": None
-        },
-        {
-            "id": 2,
-            "name": "Ligne 2",
-            "color": "Orange",
-            "status": "Service normal du métro",
-            "statusColor": "text-orange-400",
-            "icon": "orange-line",
-            "is_normal": True,
-            "alert_description": None
-        }
+        MetroLine(
+            name="Ligne 1",
+            color="Verte",
+            status="Service normal du métro",
+            statusColor="text-green-400",
+            icon="green-line",
+        ),
+        MetroLine(
+            name="Ligne 2",
+            color="Orange",
+            status="Service normal du métro",
+            statusColor="text-orange-400",
+            icon="orange-line",
+        ),
     ]
\ No newline at end of file
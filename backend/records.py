@@ -0,0 +1,89 @@
+"""
+Display Records
+Typed records for the buses, alerts and metro lines of the /api/data
+payload. They are msgspec Structs (slotted, no per-instance dict) and are
+encoded together with the surrounding dicts in one pass by
+realtime.encode_json(). Fields left UNSET are omitted from the JSON, so each
+record keeps the keys the frontend already expects.
+"""
+from typing import List, Optional, Union
+
+import msgspec
+from msgspec import UNSET, UnsetType
+
+
+class UpcomingBus(msgspec.Struct, kw_only=True):
+    """One of the next realtime departures of a combo (Bus.upcoming)."""
+    trip_id: str
+    arrival_time: int  # minutes
+    occupancy: str
+    delayed_text: Optional[str] = None
+    early_text: Optional[str] = None
+    at_stop: bool = False
+    wheelchair_accessible: bool = False
+
+
+class Bus(msgspec.Struct, kw_only=True):
+    """Next bus of a (route, stop) combo, realtime, cancelled or scheduled."""
+    route_id: str
+    trip_id: str
+    stop_id: str
+    arrival_time: Union[int, str]  # minutes, "Annulé" or a scheduled "%I:%M %p"
+    occupancy: str
+    direction: str
+    location: str
+    delayed_text: Optional[str] = None
+    early_text: Optional[str] = None
+    at_stop: bool = False
+    wheelchair_accessible: bool = False
+    cancelled: bool = False
+    service_status: str = "normal"
+    # Vehicle position, realtime arrivals only
+    lat: Union[float, None, UnsetType] = UNSET
+    lon: Union[float, None, UnsetType] = UNSET
+    current_status: Union[int, None, UnsetType] = UNSET
+    upcoming: Union[List[UpcomingBus], UnsetType] = UNSET
+
+    def upcoming_entry(self):
+        return UpcomingBus(
+            trip_id=self.trip_id,
+            arrival_time=self.arrival_time,
+            occupancy=self.occupancy,
+            delayed_text=self.delayed_text,
+            early_text=self.early_text,
+            at_stop=self.at_stop,
+            wheelchair_accessible=self.wheelchair_accessible,
+        )
+
+
+class Alert(msgspec.Struct, kw_only=True):
+    """STM alert kept by process_stm_alerts() for our routes and stops."""
+    header: str
+    description: str
+    routes: List[str] = []
+    stops: List[str] = []
+    is_network_wide: bool = False
+    alert_type: str = "info"
+    severity: str = "info"
+    effect: Optional[str] = None  # GTFS-RT effect when known; NO_SERVICE cancels the route
+
+
+class BannerAlert(msgspec.Struct, kw_only=True):
+    """Alert as shown in the display banner ("alerts" in /api/data)."""
+    header: str
+    description: str
+    alert_type: str
+    severity: str
+    routes: str
+    stop: str
+
+
+class MetroLine(msgspec.Struct, kw_only=True):
+    """Status of one metro line ("metro_lines" in /api/data)."""
+    name: str
+    color: str
+    status: str = "Service normal"
+    statusColor: str = "text-green-400"
+    icon: str
+    is_normal: bool = True
+    alert_description: Optional[str] = None